@@ -0,0 +1,190 @@
+"""
+TTL-bound cache of Cortex Analyst responses shared by the analyst apps.
+
+Responses are keyed by a hash of the normalized message history, the semantic model path and the checksum of the
+semantic model file on its stage, so editing the YAML invalidates every answer built from it. Entries live in an LRU
+memory tier and, optionally, in a SQLite file that survives app restarts. Only successful responses are cached.
+
+For Streamlit in Snowflake apps, upload this file next to the app file so that it can be imported.
+
+Usage:
+    cache = analyst_cache.get_cache()
+    checksum = cache.stage_file_checksum(semantic_model_file, list_stage)
+    key = cache.key(messages, semantic_model_file, checksum)
+    response = cache.get(key)
+    if response is None:
+        response = call_analyst(...)
+        cache.put(key, response)
+"""
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 256  # Responses kept in memory
+DEFAULT_TTL_SECONDS = 3600.0  # Seconds a response is served from the cache
+CHECKSUM_TTL_SECONDS = 60.0  # Seconds a stage file checksum is reused before running LIST again
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_messages(messages: List[Dict]) -> List[Dict]:
+    """
+    Reduce a conversation to what the analyst answer depends on: roles and content, with whitespace in text collapsed.
+    Request ids and other bookkeeping fields are dropped.
+    """
+    normalized = []
+    for message in messages:
+        content = []
+        for item in message.get("content", []):
+            item = dict(item)
+            if item.get("type") == "text":
+                item["text"] = _WHITESPACE.sub(" ", item.get("text", "")).strip()
+            content.append(item)
+        normalized.append({"role": message.get("role"), "content": content})
+    return normalized
+
+
+class AnalystResponseCache:
+    """LRU + optional SQLite cache of analyst responses with TTL eviction and hit/miss counters."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 sqlite_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (stored_at, response)
+        self._checksums = {}  # semantic model file -> (checked_at, checksum)
+        self._stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "expired": 0}
+
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS analyst_response_cache "
+                "(key TEXT PRIMARY KEY, stored_at REAL NOT NULL, response TEXT NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def key(messages: List[Dict], semantic_model_file: str, checksum: str = "") -> str:
+        """Cache key for a conversation asked against a semantic model file with the given stage checksum."""
+        document = json.dumps(
+            {"messages": normalize_messages(messages), "semantic_model_file": semantic_model_file.lower(),
+             "checksum": checksum},
+            sort_keys=True, ensure_ascii=False,
+        )
+        return hashlib.sha256(document.encode("utf-8")).hexdigest()
+
+    def stage_file_checksum(self, semantic_model_file: str, list_stage: Callable[[str], List]) -> str:
+        """
+        Return the MD5 checksum of a staged semantic model file, running LIST at most every CHECKSUM_TTL_SECONDS.
+        :param semantic_model_file: Stage path such as "@db.schema.stage/model.yml".
+        :param list_stage: Runs `LIST <path>` and returns its rows as dicts (or Rows) with "name" and "md5".
+        :return: the checksum, or "" if the file could not be listed
+        """
+        now = time.monotonic()
+        with self._lock:
+            cached = self._checksums.get(semantic_model_file)
+            if cached is not None and now - cached[0] < CHECKSUM_TTL_SECONDS:
+                return cached[1]
+        try:
+            rows = list_stage(semantic_model_file if semantic_model_file.startswith("@") else "@" + semantic_model_file)
+            checksum = ",".join(sorted(f"{row['name']}:{row['md5']}" for row in rows))
+        except Exception:
+            logger.warning("Could not read the checksum of %s", semantic_model_file, exc_info=True)
+            checksum = ""
+        with self._lock:
+            self._checksums[semantic_model_file] = (now, checksum)
+        return checksum
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the cached response for `key`, or None if it is missing or older than the TTL."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+                self._stats["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT stored_at, response FROM analyst_response_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if now - row[0] <= self.ttl_seconds:
+                        response = json.loads(row[1])
+                        self._remember(key, row[0], response)
+                        self._stats["hits"] += 1
+                        self._stats["disk_hits"] += 1
+                        return response
+                    self._db.execute("DELETE FROM analyst_response_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._stats["expired"] += 1
+
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, response: Dict) -> None:
+        """Store a successful response."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, response)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO analyst_response_cache (key, stored_at, response) VALUES (?, ?, ?)",
+                    (key, now, json.dumps(response, ensure_ascii=False)),
+                )
+                self._db.execute("DELETE FROM analyst_response_cache WHERE stored_at < ?", (now - self.ttl_seconds,))
+                self._db.commit()
+
+    def _remember(self, key: str, stored_at: float, response: Dict) -> None:
+        self._memory[key] = (stored_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._checksums.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM analyst_response_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict:
+        """Return hit/miss counters plus the hit rate and the number of responses held in memory."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._memory)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+# One cache per SQLite file (None for memory only), shared by every Streamlit session and rerun in the process.
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(sqlite_path: Optional[str] = None, max_entries: int = DEFAULT_MAX_ENTRIES,
+              ttl_seconds: float = DEFAULT_TTL_SECONDS) -> AnalystResponseCache:
+    """Return the process-wide cache for `sqlite_path`, creating it on first use."""
+    with _caches_lock:
+        cache = _caches.get(sqlite_path)
+        if cache is None:
+            cache = AnalystResponseCache(max_entries=max_entries, ttl_seconds=ttl_seconds, sqlite_path=sqlite_path)
+            _caches[sqlite_path] = cache
+    return cache
@@ -0,0 +1,261 @@
+"""
+Bounded, process-wide pool of Snowflake connections shared by the demo apps.
+
+Connections are grouped by (role, warehouse, database, schema), so a connection is only reused with the same session
+context it was opened with. Idle connections are health-checked before reuse and closed after `idle_timeout`
+seconds. `stats()` reports the hit rate and checkout wait time for sizing the pool.
+
+Usage:
+    pool = connection_pool.get_pool(account=..., user=..., password=..., role=..., warehouse=...)
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        ...
+"""
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import snowflake.connector
+
+logger = logging.getLogger(__name__)
+
+# Session context that a pooled connection is bound to.
+POOL_KEY_FIELDS = ("role", "warehouse", "database", "schema")
+
+DEFAULT_MAX_SIZE = 4  # Connections per (role, warehouse, database, schema)
+DEFAULT_IDLE_TIMEOUT = 600.0  # Seconds an idle connection is kept open
+DEFAULT_HEALTH_CHECK_INTERVAL = 60.0  # Seconds after which an idle connection is pinged before reuse
+DEFAULT_CHECKOUT_TIMEOUT = 30.0  # Seconds to wait for a free connection
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used_at", "last_checked_at")
+
+    def __init__(self, conn):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used_at = now
+        self.last_checked_at = now
+
+
+class ConnectionPool:
+    """A bounded pool of snowflake.connector connections keyed by (role, warehouse, database, schema)."""
+
+    def __init__(self, connect_kwargs: dict, max_size: int = DEFAULT_MAX_SIZE,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL,
+                 checkout_timeout: float = DEFAULT_CHECKOUT_TIMEOUT):
+        self._connect_kwargs = dict(connect_kwargs)
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+
+        self._cond = threading.Condition()
+        self._idle = {}  # key -> deque of idle _PooledConnection (most recently used last)
+        self._size = {}  # key -> number of open connections, idle and checked out
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "hits": 0,
+            "misses": 0,
+            "timeouts": 0,
+            "evicted": 0,
+            "unhealthy": 0,
+            "wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+
+    def key_for(self, **overrides) -> tuple:
+        """Return the pool key for the given session context, falling back to the pool's connect arguments."""
+        return tuple(overrides.get(field) or self._connect_kwargs.get(field) for field in POOL_KEY_FIELDS)
+
+    @contextmanager
+    def connection(self, **overrides):
+        """
+        Borrow a connection for the given role/warehouse/database/schema and return it to the pool afterwards.
+        Connections that were closed while borrowed are discarded instead of being returned.
+        """
+        key = self.key_for(**overrides)
+        pooled = self._checkout(key)
+        try:
+            yield pooled.conn
+        finally:
+            self._checkin(key, pooled)
+
+    def _checkout(self, key: tuple) -> _PooledConnection:
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Connection pool is closed")
+            expired = self._collect_expired_locked()
+            while True:
+                idle = self._idle.get(key)
+                if idle:
+                    pooled = idle.pop()
+                    break
+                if self._size.get(key, 0) < self.max_size:
+                    # Reserve a slot; the connection itself is opened outside the lock.
+                    self._size[key] = self._size.get(key, 0) + 1
+                    pooled = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"No Snowflake connection available for {key} within {self.checkout_timeout}s")
+                self._cond.wait(remaining)
+            waited = time.monotonic() - started
+        self._close_all(expired)
+
+        if pooled is not None and not self._is_healthy(pooled):
+            self._close_all([pooled])
+            pooled = None
+            with self._cond:
+                self._stats["unhealthy"] += 1
+
+        hit = pooled is not None
+        if pooled is None:
+            try:
+                pooled = _PooledConnection(self._connect(key))
+            except Exception:
+                with self._cond:
+                    self._size[key] -= 1
+                    self._cond.notify()
+                raise
+
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["hits" if hit else "misses"] += 1
+            self._stats["wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        return pooled
+
+    def _checkin(self, key: tuple, pooled: _PooledConnection) -> None:
+        broken = self._is_closed(pooled.conn)
+        with self._cond:
+            if broken or self._closed:
+                self._size[key] -= 1
+            else:
+                pooled.last_used_at = time.monotonic()
+                self._idle.setdefault(key, deque()).append(pooled)
+            self._cond.notify()
+        if broken or self._closed:
+            self._close_all([pooled])
+
+    def _connect(self, key: tuple):
+        kwargs = dict(self._connect_kwargs)
+        kwargs.update({field: value for field, value in zip(POOL_KEY_FIELDS, key) if value})
+        logger.info("Opening pooled Snowflake connection for role=%s, warehouse=%s, database=%s, schema=%s", *key)
+        return snowflake.connector.connect(**kwargs)
+
+    def _is_healthy(self, pooled: _PooledConnection) -> bool:
+        if self._is_closed(pooled.conn):
+            return False
+        now = time.monotonic()
+        if now - pooled.last_checked_at < self.health_check_interval:
+            return True
+        try:
+            cursor = pooled.conn.cursor()
+            try:
+                cursor.execute("SELECT 1")
+                cursor.fetchone()
+            finally:
+                cursor.close()
+        except Exception:
+            logger.warning("Pooled Snowflake connection failed its health check", exc_info=True)
+            return False
+        pooled.last_checked_at = now
+        return True
+
+    @staticmethod
+    def _is_closed(conn) -> bool:
+        try:
+            return conn.is_closed()
+        except Exception:
+            return True
+
+    def _collect_expired_locked(self) -> list:
+        """Remove idle connections past the idle timeout. The caller must hold self._cond and close the result."""
+        now = time.monotonic()
+        expired = []
+        for key, idle in self._idle.items():
+            # Idle connections are appended as they are returned, so the oldest are on the left.
+            while idle and now - idle[0].last_used_at > self.idle_timeout:
+                expired.append(idle.popleft())
+                self._size[key] -= 1
+        self._stats["evicted"] += len(expired)
+        return expired
+
+    @staticmethod
+    def _close_all(connections) -> None:
+        for pooled in connections:
+            try:
+                pooled.conn.close()
+            except Exception:
+                logger.debug("Error while closing a pooled Snowflake connection", exc_info=True)
+
+    def evict_idle(self) -> int:
+        """Close idle connections past the idle timeout and return how many were closed."""
+        with self._cond:
+            expired = self._collect_expired_locked()
+        self._close_all(expired)
+        return len(expired)
+
+    def close(self) -> None:
+        """Close every idle connection; connections still borrowed are closed when they are returned."""
+        with self._cond:
+            self._closed = True
+            idle = [pooled for connections in self._idle.values() for pooled in connections]
+            for key, connections in self._idle.items():
+                self._size[key] -= len(connections)
+            self._idle.clear()
+            self._cond.notify_all()
+        self._close_all(idle)
+
+    def stats(self) -> dict:
+        """Return pool counters plus the derived hit rate and average checkout wait time in milliseconds."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["open"] = sum(self._size.values())
+            stats["idle"] = sum(len(connections) for connections in self._idle.values())
+        checkouts = stats["checkouts"]
+        stats["hit_rate"] = stats["hits"] / checkouts if checkouts else 0.0
+        stats["avg_wait_ms"] = stats["wait_seconds"] * 1000 / checkouts if checkouts else 0.0
+        stats["max_wait_ms"] = stats["max_wait_seconds"] * 1000
+        return stats
+
+    def log_stats(self) -> None:
+        stats = self.stats()
+        logger.info("Connection pool: hit rate %.1f%% (%d/%d), avg wait %.1f ms, max wait %.1f ms, open %d, idle %d",
+                    stats["hit_rate"] * 100, stats["hits"], stats["checkouts"], stats["avg_wait_ms"],
+                    stats["max_wait_ms"], stats["open"], stats["idle"])
+
+
+# One pool per set of credentials, shared by every Streamlit session and rerun in the process.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(max_size: int = DEFAULT_MAX_SIZE, idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+             health_check_interval: float = DEFAULT_HEALTH_CHECK_INTERVAL,
+             checkout_timeout: float = DEFAULT_CHECKOUT_TIMEOUT, **connect_kwargs) -> ConnectionPool:
+    """
+    Return the process-wide pool for the given connection arguments, creating it on first use.
+    The role/warehouse/database/schema arguments are the defaults for `ConnectionPool.connection()`.
+    """
+    registry_key = tuple(sorted(connect_kwargs.items()))
+    with _pools_lock:
+        pool = _pools.get(registry_key)
+        if pool is None:
+            pool = ConnectionPool(connect_kwargs, max_size=max_size, idle_timeout=idle_timeout,
+                                  health_check_interval=health_check_interval, checkout_timeout=checkout_timeout)
+            _pools[registry_key] = pool
+    return pool
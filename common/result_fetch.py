@@ -0,0 +1,137 @@
+"""
+Arrow-native fetching of query results for the demo apps.
+
+`fetch_arrow()` reads a result set as the connector's Arrow batches (`cursor.fetch_arrow_batches()`) instead of
+building Python row tuples, stops once `max_rows` rows have been read, and returns a `QueryResult` wrapping one
+pyarrow.Table. Pages are zero-copy slices of that table and can be passed straight to `st.dataframe`; `to_pandas()`
+converts without consolidating columns into blocks, so numeric columns without nulls are not copied.
+
+Usage:
+    with pool.connection() as conn:
+        result = result_fetch.fetch_arrow(conn.cursor(), sql)
+    st.dataframe(result.page(0))
+"""
+import logging
+import math
+import time
+
+import pyarrow as pa
+from snowflake.connector.errors import NotSupportedError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ROWS = 100_000  # Rows kept per query; the rest of the result set is not downloaded
+DEFAULT_PAGE_SIZE = 1_000  # Rows per page in the table view
+
+
+class QueryResult:
+    """A capped, Arrow-backed query result with fetch statistics."""
+
+    def __init__(self, table: pa.Table, truncated: bool, elapsed: float, query_id: str = None, cached: bool = False):
+        self.table = table
+        self.truncated = truncated
+        self.elapsed = elapsed
+        self.query_id = query_id
+        self.cached = cached
+
+    @property
+    def num_rows(self) -> int:
+        return self.table.num_rows
+
+    @property
+    def nbytes(self) -> int:
+        return self.table.nbytes
+
+    @property
+    def columns(self) -> list:
+        return self.table.column_names
+
+    def num_pages(self, page_size: int = DEFAULT_PAGE_SIZE) -> int:
+        return max(1, math.ceil(self.num_rows / page_size))
+
+    def page(self, page_number: int, page_size: int = DEFAULT_PAGE_SIZE) -> pa.Table:
+        """Return one page of rows as a zero-copy slice of the result table (page_number starts at 0)."""
+        return self.table.slice(page_number * page_size, page_size)
+
+    def to_pandas(self):
+        """Convert the whole result to a pandas DataFrame, avoiding copies where Arrow allows it."""
+        return self.table.to_pandas(split_blocks=True)
+
+    def summary(self) -> str:
+        capped = " (row cap reached)" if self.truncated else ""
+        if self.cached:
+            return f"{self.num_rows:,} rows{capped}, {self.nbytes / 1024 ** 2:.2f} MB served from the result cache"
+        return f"{self.num_rows:,} rows{capped}, {self.nbytes / 1024 ** 2:.2f} MB fetched in {self.elapsed:.2f} s"
+
+
+def fetch_arrow(cursor, sql: str, max_rows: int = DEFAULT_MAX_ROWS, params=None) -> QueryResult:
+    """
+    Execute `sql` and read at most `max_rows` rows of its result as Arrow batches. The cursor is closed afterwards,
+    which discards any batches beyond the cap without downloading them.
+    """
+    started = time.perf_counter()
+    try:
+        cursor.execute(sql, params)
+        columns = [col[0] for col in cursor.description]
+        try:
+            batches, truncated = _read_batches(cursor.fetch_arrow_batches(), max_rows)
+        except NotSupportedError:
+            # Statements such as SHOW/DESC return JSON results, which have no Arrow batches.
+            rows = cursor.fetchmany(max_rows + 1)
+            truncated = len(rows) > max_rows
+            rows = rows[:max_rows]
+            batches = [pa.table({name: [row[i] for row in rows] for i, name in enumerate(columns)})]
+        query_id = cursor.sfqid
+    finally:
+        cursor.close()
+
+    if batches:
+        table = pa.concat_tables(batches, promote_options="default")
+    else:
+        table = pa.table({name: pa.array([], type=pa.null()) for name in columns})
+
+    result = QueryResult(table, truncated, time.perf_counter() - started, query_id)
+    logger.info("Query %s: %s", query_id, result.summary())
+    return result
+
+
+def cached_fetch_arrow(conn, sql: str, cache, role: str, warehouse: str,
+                       max_rows: int = DEFAULT_MAX_ROWS) -> QueryResult:
+    """
+    Like fetch_arrow(), but serve the result from a sql_result_cache.SQLResultCache when the same normalized SQL
+    already ran under the same role and warehouse, and store fresh results in it.
+    """
+    def run_query(statement):
+        cursor = conn.cursor()
+        try:
+            return cursor.execute(statement).fetchall()
+        finally:
+            cursor.close()
+
+    started = time.perf_counter()
+    cached = cache.get(sql, role, warehouse, run_query)
+    if cached is not None:
+        table, metadata = cached
+        result = QueryResult(table, metadata.get("truncated", False), time.perf_counter() - started,
+                             metadata.get("query_id"), cached=True)
+        logger.info("Query %s: %s", result.query_id, result.summary())
+        return result
+
+    result = fetch_arrow(conn.cursor(), sql, max_rows=max_rows)
+    cache.put(sql, role, warehouse, result.table, {"query_id": result.query_id, "truncated": result.truncated},
+              run_query)
+    return result
+
+
+def _read_batches(batches, max_rows: int):
+    tables = []
+    rows = 0
+    for batch in batches:
+        if rows >= max_rows:
+            return tables, True
+        if rows + batch.num_rows > max_rows:
+            tables.append(batch.slice(0, max_rows - rows))
+            return tables, True
+        tables.append(batch)
+        rows += batch.num_rows
+    return tables, False
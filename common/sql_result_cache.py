@@ -0,0 +1,307 @@
+"""
+Result cache for SQL generated by Cortex Analyst / Cortex Agents, shared across reruns and sessions.
+
+Results are keyed by the normalized SQL text (whitespace collapsed, case folded outside quoted literals and
+identifiers, trailing semicolons removed) plus the role and warehouse it ran under, and are stored as Arrow tables.
+The memory tier is evicted least-recently-used first once it exceeds a byte budget; an optional directory keeps
+results as Parquet files under the same budget so they survive app restarts.
+
+With `check_freshness=True`, the tables scanned by the query are recorded together with their `LAST_ALTERED`
+timestamps, and a cached result is only served while those timestamps are unchanged.
+
+`run_query` arguments are callables that execute a SQL statement and return its rows as tuples, so the cache works
+with both snowflake.connector cursors and Snowpark sessions. For Streamlit in Snowflake apps, upload this file next to
+the app file so that it can be imported.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 1024 ** 2  # Arrow bytes kept per tier
+DEFAULT_TTL_SECONDS = 3600.0  # Seconds a result is served without re-running the query
+
+RunQuery = Callable[[str], List[tuple]]
+
+# Quoted literals and identifiers are kept as-is; everything else is whitespace-collapsed and lower-cased.
+_QUOTED = re.compile(r"('(?:[^'\\]|\\.|'')*'|\"(?:[^\"]|\"\")*\")")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """Normalize SQL text so that formatting-only differences map to the same cache key."""
+    parts = []
+    for index, part in enumerate(_QUOTED.split(sql.strip())):
+        if index % 2:
+            parts.append(part)
+        else:
+            parts.append(_WHITESPACE.sub(" ", part).lower())
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def _quote(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def scanned_tables(run_query: RunQuery, query_id: str) -> List[str]:
+    """Return the fully qualified names of the tables scanned by a finished query."""
+    rows = run_query(
+        "select distinct operator_attributes:table_name::string "
+        f"from table(get_query_operator_stats({_quote(query_id)})) "
+        "where operator_type = 'TableScan'"
+    )
+    return sorted(row[0] for row in rows if row[0])
+
+
+def tables_last_altered(run_query: RunQuery, tables: List[str]) -> Dict[str, str]:
+    """Return {fully qualified table name: LAST_ALTERED} for the given tables, one query per database."""
+    by_database = {}
+    for table in tables:
+        database, _, schema_table = table.partition(".")
+        by_database.setdefault(database, []).append(schema_table)
+
+    last_altered = {}
+    for database, schema_tables in by_database.items():
+        rows = run_query(
+            "select table_catalog || '.' || table_schema || '.' || table_name, last_altered::string "
+            f"from {database}.information_schema.tables "
+            f"where table_schema || '.' || table_name in ({', '.join(_quote(t) for t in schema_tables)})"
+        )
+        last_altered.update({row[0]: row[1] for row in rows})
+    return last_altered
+
+
+class _Entry:
+    __slots__ = ("table", "metadata", "stored_at")
+
+    def __init__(self, table: pa.Table, metadata: Dict, stored_at: float):
+        self.table = table
+        self.metadata = metadata
+        self.stored_at = stored_at
+
+
+class SQLResultCache:
+    """Arrow result cache keyed by normalized SQL, role and warehouse, with a byte budget per tier."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 directory: Optional[str] = None, check_freshness: bool = False):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.directory = directory
+        self.check_freshness = check_freshness
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> _Entry
+        self._memory_bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "evicted": 0}
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(sql: str, role: Optional[str], warehouse: Optional[str]) -> str:
+        document = json.dumps([normalize_sql(sql), (role or "").upper(), (warehouse or "").upper()])
+        return hashlib.sha256(document.encode("utf-8")).hexdigest()
+
+    def get(self, sql: str, role: Optional[str], warehouse: Optional[str],
+            run_query: Optional[RunQuery] = None) -> Optional[Tuple[pa.Table, Dict]]:
+        """
+        Return (table, metadata) for a cached result, or None.
+        :param run_query: needed when check_freshness is enabled, to read the current LAST_ALTERED timestamps
+        """
+        key = self.key(sql, role, warehouse)
+        entry = self._get_entry(key)
+        if entry is None:
+            return self._miss()
+        if time.time() - entry.stored_at > self.ttl_seconds:
+            self._drop(key)
+            return self._miss(stale=True)
+
+        base_tables = entry.metadata.get("base_tables")
+        if self.check_freshness and base_tables and run_query is not None:
+            try:
+                current = tables_last_altered(run_query, list(base_tables))
+            except Exception:
+                logger.warning("Could not check LAST_ALTERED of %s", list(base_tables), exc_info=True)
+                current = None
+            if current != base_tables:
+                logger.info("Cached result is stale; base tables changed since it was stored")
+                self._drop(key)
+                return self._miss(stale=True)
+
+        with self._lock:
+            self._stats["hits"] += 1
+        return entry.table, entry.metadata
+
+    def put(self, sql: str, role: Optional[str], warehouse: Optional[str], table: pa.Table,
+            metadata: Optional[Dict] = None, run_query: Optional[RunQuery] = None) -> None:
+        """
+        Store a result. With check_freshness, `metadata["query_id"]` and `run_query` are used to record the scanned
+        tables and their LAST_ALTERED timestamps.
+        """
+        if table.nbytes > self.max_bytes:
+            logger.info("Result of %.1f MB exceeds the cache budget; not cached", table.nbytes / 1024 ** 2)
+            return
+        metadata = dict(metadata or {})
+        if self.check_freshness and run_query is not None and metadata.get("query_id"):
+            try:
+                metadata["base_tables"] = tables_last_altered(
+                    run_query, scanned_tables(run_query, metadata["query_id"])
+                )
+            except Exception:
+                logger.warning("Could not record the base tables of query %s", metadata["query_id"], exc_info=True)
+
+        key = self.key(sql, role, warehouse)
+        entry = _Entry(table, metadata, time.time())
+        with self._lock:
+            self._remember(key, entry)
+        if self.directory:
+            self._write_parquet(key, entry)
+
+    def _miss(self, stale: bool = False) -> None:
+        with self._lock:
+            self._stats["misses"] += 1
+            if stale:
+                self._stats["stale"] += 1
+        return None
+
+    def _get_entry(self, key: str) -> Optional[_Entry]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                return entry
+        if not self.directory:
+            return None
+        entry = self._read_parquet(key)
+        if entry is not None:
+            with self._lock:
+                self._remember(key, entry)
+        return entry
+
+    def _remember(self, key: str, entry: _Entry) -> None:
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= previous.table.nbytes
+        self._memory[key] = entry
+        self._memory_bytes += entry.table.nbytes
+        while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.table.nbytes
+            self._stats["evicted"] += 1
+
+    def _drop(self, key: str) -> None:
+        with self._lock:
+            entry = self._memory.pop(key, None)
+            if entry is not None:
+                self._memory_bytes -= entry.table.nbytes
+        if self.directory:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".parquet")
+
+    def _write_parquet(self, key: str, entry: _Entry) -> None:
+        schema_metadata = dict(entry.table.schema.metadata or {})
+        schema_metadata[b"sql_result_cache"] = json.dumps(
+            {"metadata": entry.metadata, "stored_at": entry.stored_at}
+        ).encode("utf-8")
+        path = self._path(key)
+        try:
+            pq.write_table(entry.table.replace_schema_metadata(schema_metadata), path + ".tmp",
+                           compression="zstd")
+            os.replace(path + ".tmp", path)
+        except Exception:
+            logger.warning("Could not write cached result to %s", path, exc_info=True)
+            return
+        self._evict_directory()
+
+    def _read_parquet(self, key: str) -> Optional[_Entry]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            table = pq.read_table(path)
+        except Exception:
+            logger.warning("Could not read cached result from %s", path, exc_info=True)
+            return None
+        schema_metadata = dict(table.schema.metadata or {})
+        stored = json.loads(schema_metadata.pop(b"sql_result_cache", b"{}"))
+        return _Entry(table.replace_schema_metadata(schema_metadata or None), stored.get("metadata", {}),
+                      stored.get("stored_at", 0.0))
+
+    def _evict_directory(self) -> None:
+        """Delete the least recently written Parquet files until the directory fits in the byte budget."""
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".parquet"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+def cached_snowpark_to_pandas(session, sql: str, cache: Optional[SQLResultCache] = None):
+    """
+    Run `sql` with a Snowpark session and return it as a pandas DataFrame, serving repeated queries from `cache`
+    (the process-wide memory cache by default). Snowpark errors are raised to the caller.
+    """
+    cache = cache or get_cache()
+    role = session.get_current_role()
+    warehouse = session.get_current_warehouse()
+
+    def run_query(statement):
+        return [tuple(row) for row in session.sql(statement).collect()]
+
+    cached = cache.get(sql, role, warehouse, run_query)
+    if cached is not None:
+        return cached[0].to_pandas()
+
+    with session.query_history() as history:
+        df = session.sql(sql).to_pandas()
+    query_id = history.queries[-1].query_id if history.queries else None
+    cache.put(sql, role, warehouse, pa.Table.from_pandas(df, preserve_index=False), {"query_id": query_id},
+              run_query)
+    return df
+
+
+# One cache per directory (None for memory only), shared by every Streamlit session and rerun in the process.
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(directory: Optional[str] = None, max_bytes: int = DEFAULT_MAX_BYTES,
+              ttl_seconds: float = DEFAULT_TTL_SECONDS, check_freshness: bool = False) -> SQLResultCache:
+    """Return the process-wide cache for `directory`, creating it on first use."""
+    with _caches_lock:
+        cache = _caches.get(directory)
+        if cache is None:
+            cache = SQLResultCache(max_bytes=max_bytes, ttl_seconds=ttl_seconds, directory=directory,
+                                   check_freshness=check_freshness)
+            _caches[directory] = cache
+    return cache
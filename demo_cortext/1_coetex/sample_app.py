@@ -1,3 +1,7 @@
+import calendar
+import json
+import re
+import unicodedata
 import streamlit as st
 from collections import defaultdict
 from snowflake.core import Root
@@ -7,9 +11,143 @@ FIXED_DATABASE = "INTERNAL_KPI_DEV"
 FIXED_SCHEMA = "HARATO_TEST_SCHEMA"
 SEARCH_SERVICE_NAME = "opportunity_history_search_service"
 
+SEARCH_COLUMNS = [
+    "emp_name", "opportunity_history",
+    "bd_project_code", "end_client_name", "opportunity_name", "opportunity_category",
+    "analytics_tool_name", "bi_tool_name", "etl_tool_name", "ma_tool_name",
+    "project_start_date", "project_end_date"
+]
+# キーワードとの照合に使う列
+MATCH_COLUMNS = [
+    "emp_name", "end_client_name", "opportunity_name", "opportunity_category",
+    "analytics_tool_name", "bi_tool_name", "etl_tool_name", "ma_tool_name",
+    "project_start_date", "project_end_date", "opportunity_history"
+]
+
+SEARCH_BATCH_SIZE = 100        # 最初に取得する検索結果の件数（足りなければ倍にして取り直す）
+MAX_SEARCH_LIMIT = 1000        # 検索結果を取得する上限（Cortex Search の limit の最大値）
+DEFAULT_TARGET_PROJECTS = 30   # すべてのキーワードに一致するプロジェクトがこの件数見つかれば検索を止める
+
+# 値にキーワードを含むものを検索サービスの filter（@eq）で絞り込む列（検索サービスの ATTRIBUTES に含める）
+FILTER_COLUMNS = ["analytics_tool_name", "bi_tool_name", "end_client_name"]
+MAX_FILTER_VALUES = 50  # キーワードを含む値がこれより多ければ絞り込みに使わず、検索結果の照合だけで確認する
+ATTRIBUTE_VALUES_TTL_SECONDS = 3600  # 列の値の一覧をキャッシュする秒数
+
+# 期間として扱うキーワード（2024年 / 2024年4月 / 2024-04 / 2024/4）
+# "2010" や "202404" のような数字だけのキーワードは、案件番号などと区別できないため期間にしない
+DATE_TERM = re.compile(r"^((?:19|20)\d{2})(?:年|年(\d{1,2})月|[-/](\d{1,2}))$")
+
+# 部分一致で照合するキーワード（ひらがな・カタカナ・漢字を含むもの）
+CJK_CHARS = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
 session = get_active_session()
 root = Root(session)
 
+
+# 全角英数字・半角カナなどの表記ゆれを NFKC でそろえ、大文字・小文字を区別しないようにする
+def normalize_text(text):
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+# 検索結果1件を照合用に1回だけ正規化した本文にする
+def index_result(r):
+    return normalize_text(" ".join(str(r.get(column) or "") for column in MATCH_COLUMNS))
+
+
+# キーワードが本文に含まれるか
+# 英数字のキーワードは前後が英数字でない位置だけで一致させ（"ana" は "banana" に一致しない）、
+# 区切りのない日本語（かな・漢字）を含むキーワードだけは部分一致で確認する
+def matches_term(keyword, text):
+    if CJK_CHARS.search(keyword):
+        return keyword in text
+    return re.search(rf"(?<![0-9a-z]){re.escape(keyword)}(?![0-9a-z])", text) is not None
+
+
+# すべてのキーワードを含むか
+def matches_all(keywords, text):
+    return all(matches_term(k, text) for k in keywords)
+
+
+# 絞り込みに使う列の値の一覧を {正規化した値: [(列名, 値), ...]} で返す（検索サービスのインデックスから読む）
+@st.cache_data(ttl=ATTRIBUTE_VALUES_TTL_SECONDS, show_spinner=False)
+def load_attribute_values():
+    service_name = f"{FIXED_DATABASE}.{FIXED_SCHEMA}.{SEARCH_SERVICE_NAME}"
+    rows = session.sql(f"""
+        select distinct lower(column_name) as column_name, value
+        from (
+            select {", ".join(FILTER_COLUMNS)}
+            from table(cortex_search_data_scan(service_name => '{service_name}'))
+        ) unpivot (value for column_name in ({", ".join(FILTER_COLUMNS)}))
+    """).collect()
+    attribute_values = defaultdict(list)
+    for row in rows:
+        if row["VALUE"]:
+            attribute_values[normalize_text(row["VALUE"])].append((row["COLUMN_NAME"], row["VALUE"]))
+    return dict(attribute_values)
+
+
+# 年・年月のキーワードを (開始日, 終了日) にする。期間でなければ None
+def parse_date_term(term):
+    m = DATE_TERM.match(term)
+    if not m:
+        return None
+    year = int(m.group(1))
+    if m.group(2) is None and m.group(3) is None:
+        return f"{year:04d}-01-01", f"{year:04d}-12-31"
+    month = int(m.group(2) or m.group(3))
+    if not 1 <= month <= 12:
+        return None
+    return f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+
+
+# キーワードのうち列の値や期間に当たるものを検索サービスの filter にし、(filter, 残りのキーワード) を返す
+# 列の値は、キーワードを含む値（照合と同じ規則。"ANA" なら "ANAホールディングス" も）のいずれかに一致するもの
+# そのため、キーワードが FILTER_COLUMNS 以外（ETL・MA ツールや案件説明）にだけ書かれた結果は対象外になる
+# 期間は、プロジェクトの期間がその年・月と重なるもの（開始日 <= 期間の終わり かつ 終了日 >= 期間の始め）
+def build_search_filter(terms, attribute_values):
+    conditions = []
+    text_terms = []
+    for term in terms:
+        normalized = normalize_text(term)
+        date_range = parse_date_term(normalized)
+        values = [
+            (column, value)
+            for key, column_values in attribute_values.items() if matches_term(normalized, key)
+            for column, value in column_values
+        ]
+        if 0 < len(values) <= MAX_FILTER_VALUES:
+            matches = [{"@eq": {column: value}} for column, value in values]
+            conditions.append(matches[0] if len(matches) == 1 else {"@or": matches})
+        elif date_range is not None:
+            conditions.append({"@lte": {"project_start_date": date_range[1]}})
+            conditions.append({"@gte": {"project_end_date": date_range[0]}})
+        else:
+            text_terms.append(term)
+    if not conditions:
+        return None, text_terms
+    return (conditions[0] if len(conditions) == 1 else {"@and": conditions}), text_terms
+
+
+# すべてのキーワードに一致するプロジェクト（社員・案件）が target_projects 件見つかるか、上限に達するまで検索結果を取得する
+# 検索サービスには offset がないため、limit を倍にして取り直し、前回までに確認した件数より後ろだけを照合する
+def search_matching_results(cortex_search_service, query, keywords, target_projects, search_filter=None):
+    matched = []
+    projects = set()
+    checked = 0
+    limit = SEARCH_BATCH_SIZE
+    while True:
+        results = cortex_search_service.search(
+            query=query, columns=SEARCH_COLUMNS, filter=search_filter, limit=limit
+        ).results
+        for r in results[checked:]:
+            if matches_all(keywords, index_result(r)):
+                matched.append(r)
+                projects.add((r.get("emp_name", ""), r.get("opportunity_name", "")))
+        checked = len(results)
+        if len(projects) >= target_projects or checked < limit or limit >= MAX_SEARCH_LIMIT:
+            return matched, checked
+        limit = min(limit * 2, MAX_SEARCH_LIMIT)
+
 st.title("🔍 プロジェクト履歴検索")
 
 query = st.text_input(
@@ -17,54 +155,73 @@ query = st.text_input(
     placeholder="社員名、クライアント名、ツールなどをスペースで区切って入力"
 )
 
+target_projects = st.number_input(
+    "表示するプロジェクト数（見つかるまで検索結果を追加で取得します）",
+    min_value=1, max_value=200, value=DEFAULT_TARGET_PROJECTS, step=1
+)
+
+use_search_filter = st.checkbox(
+    "ツール名・クライアント名・期間は検索サービス側で絞り込む",
+    value=True,
+    help="オンにすると分析・BI ツール名やクライアント名の列で絞り込むため、"
+         "ETL・MA ツールや案件説明にだけ書かれた名前の結果は表示されません。"
+)
+
 if query:
     cortex_search_service = root.databases[FIXED_DATABASE].schemas[FIXED_SCHEMA].cortex_search_services[SEARCH_SERVICE_NAME]
 
-    results = cortex_search_service.search(
-        query=query,
-        columns=[
-            "emp_name", "opportunity_history",
-            "bd_project_code", "end_client_name", "opportunity_name", "opportunity_category",
-            "analytics_tool_name", "bi_tool_name", "etl_tool_name", "ma_tool_name",
-            "project_start_date", "project_end_date"
-        ],
-        limit=100
-    )
-
-    keywords = query.strip().split()
-    st.subheader(f"🔎 『{'・'.join(keywords)}』をすべて含むプロジェクト履歴")
-
-    if not results.results:
+    # 列の値や期間に当たるキーワードは検索サービス側で絞り込み、残りのキーワードだけを検索文とAND条件に使う
+    terms = query.strip().split()
+    search_filter, text_terms = None, terms
+    if use_search_filter:
+        try:
+            search_filter, text_terms = build_search_filter(terms, load_attribute_values())
+        except Exception as e:
+            # 絞り込みに使う値を読めなくても検索はできるので、キーワードだけで検索する
+            st.warning(f"絞り込みに使う列の値を読み込めなかったため、キーワードだけで検索します。（{e}）")
+    try:
+        matched, checked = search_matching_results(
+            cortex_search_service, " ".join(text_terms) or query, [normalize_text(t) for t in text_terms],
+            target_projects, search_filter
+        )
+    except Exception:
+        if search_filter is None:
+            raise
+        # 検索サービスの ATTRIBUTES に含まれない列などで絞り込めない場合は、すべてのキーワードで検索する
+        st.warning("検索サービス側での絞り込みに失敗したため、キーワードだけで検索します。")
+        search_filter = None
+        matched, checked = search_matching_results(
+            cortex_search_service, query, [normalize_text(t) for t in terms], target_projects
+        )
+    if search_filter is not None:
+        with st.expander("検索サービスに渡した絞り込み条件"):
+            st.code(json.dumps(search_filter, ensure_ascii=False, indent=2), language="json")
+    st.subheader(f"🔎 『{'・'.join(query.strip().split())}』をすべて含むプロジェクト履歴")
+    st.caption(f"検索結果 {checked} 件のうち {len(matched)} 件が一致")
+
+    if checked == 0:
         st.info("該当するプロジェクトは見つかりませんでした。")
     else:
         # 社員 → 案件 → 明細 の入れ子 + 開始日つきで管理
         grouped = defaultdict(lambda: defaultdict(list))
 
-        for r in results.results:
+        for r in matched:
             emp_name = r.get("emp_name", "")
             opp_name = r.get("opportunity_name", "")
-            client = r.get("end_client_name", "")
-            category = r.get("opportunity_category", "")
             tools = "・".join([
                 r.get("analytics_tool_name", "N/A"),
                 r.get("bi_tool_name", "N/A"),
                 r.get("etl_tool_name", "N/A"),
                 r.get("ma_tool_name", "N/A")
             ])
-            start_date = r.get("project_start_date", "")
-            end_date = r.get("project_end_date", "")
-            history = r.get("opportunity_history", "")
-
-            text_all = f"{emp_name} {client} {opp_name} {category} {tools} {start_date} {end_date} {history}"
-            if all(k in text_all for k in keywords):
-                grouped[emp_name][opp_name].append({
-                    "client": client,
-                    "category": category,
-                    "tools": tools,
-                    "start_date": start_date,
-                    "end_date": end_date,
-                    "history": history
-                })
+            grouped[emp_name][opp_name].append({
+                "client": r.get("end_client_name", ""),
+                "category": r.get("opportunity_category", ""),
+                "tools": tools,
+                "start_date": r.get("project_start_date", ""),
+                "end_date": r.get("project_end_date", ""),
+                "history": r.get("opportunity_history", "")
+            })
 
         if not grouped:
             st.info("検索にはヒットしましたが、すべてのキーワードに一致する結果は見つかりませんでした。")
@@ -2,9 +2,16 @@ from typing import Dict, List, Optional
 
 import _snowflake
 import json
+import sys
+from pathlib import Path
 import streamlit as st
 from snowflake.snowpark.context import get_active_session
 
+# 共通モジュール（<repo root>/common）。Streamlit in Snowflake ではこのファイルと同じ場所にアップロードする
+sys.path.append(str(Path(__file__).resolve().parents[2] / "common"))
+import analyst_cache
+import sql_result_cache
+
 # あなたのステージの設定
 DATABASE = "INTERNAL_KPI_DEV"
 SCHEMA = "HARATO_TEST_SCHEMA"
@@ -12,20 +19,32 @@ STAGE = "PUBLIC"
 FILE = "sample.yml"
 
 def send_message(prompt: str) -> dict:
-    """Calls the Cortex Analyst API and returns the response."""
+    """Calls the Cortex Analyst API and returns the response (cached per question and semantic model file)."""
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": prompt
+                }
+            ]
+        }
+    ]
+    semantic_model_file = f"@{DATABASE}.{SCHEMA}.{STAGE}/{FILE}"
+
+    cache = analyst_cache.get_cache()
+    checksum = cache.stage_file_checksum(
+        semantic_model_file, lambda path: get_active_session().sql(f"LIST {path}").collect()
+    )
+    cache_key = cache.key(messages, semantic_model_file, checksum)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     request_body = {
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": prompt
-                    }
-                ]
-            }
-        ],
-        "semantic_model_file": f"@{DATABASE}.{SCHEMA}.{STAGE}/{FILE}",
+        "messages": messages,
+        "semantic_model_file": semantic_model_file,
     }
 
     resp = _snowflake.send_snow_api_request(
@@ -39,7 +58,9 @@ def send_message(prompt: str) -> dict:
     )
 
     if resp["status"] < 400:
-        return json.loads(resp["content"])
+        response = json.loads(resp["content"])
+        cache.put(cache_key, response)
+        return response
     else:
         st.session_state.messages.pop()
         raise Exception(
@@ -84,14 +105,12 @@ def display_content(
         elif item["type"] == "sql":
             display_sql(item["statement"])
 
-@st.cache_data
 def display_sql(sql: str) -> None:
     with st.expander("SQLクエリ", expanded=False):
         st.code(sql, language="sql")
     with st.expander("結果", expanded=True):
         with st.spinner("SQLを実行中..."):
-            session = get_active_session()
-            df = session.sql(sql).to_pandas()
+            df = sql_result_cache.cached_snowpark_to_pandas(get_active_session(), sql)
             if len(df.index) > 1:
                 data_tab, line_tab, bar_tab = st.tabs(["データ", "折れ線グラフ", "棒グラフ"])
                 data_tab.dataframe(df)
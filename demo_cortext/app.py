@@ -3,13 +3,21 @@ import streamlit as st
 import json
 import requests
 import os
+import sys
 import logging
-import pandas as pd
-import snowflake.connector
+from pathlib import Path
 from typing import List, Optional
 from dotenv import load_dotenv
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.backends import default_backend
+from snowflake.connector import DictCursor
+
+# 共通モジュール（<repo root>/common）
+sys.path.append(str(Path(__file__).resolve().parents[1] / "common"))
+import analyst_cache
+import connection_pool
+import result_fetch
+import sql_result_cache
 
 # ログ設計
 load_dotenv(override=True)
@@ -34,6 +42,9 @@ STAGE_CORTEX = "demo_stage"
 FILE_CORTEX = "cust_info.yml"
 WAREHOUSE_CORTEX = "d_harato_wh"
 
+MAX_RESULT_ROWS = 100_000  # 1クエリあたりに取得する最大行数
+RESULT_PAGE_SIZE = 1_000   # テーブル表示の1ページあたりの行数
+
 # RSA秘密鍵の読み込みと DER 形式への変換
 private_key_obj = serialization.load_pem_private_key(
     SNOWFLAKE_PRIVATE_KEY.encode(),
@@ -46,7 +57,8 @@ private_key = private_key_obj.private_bytes(
     encryption_algorithm=serialization.NoEncryption()
 )
 
-st.session_state.conn = snowflake.connector.connect(
+# 接続はプロセス全体で共有するプールから借りる（リラン毎の再ログインを避ける）
+POOL = connection_pool.get_pool(
     user=SNOWFLAKE_USER,
     account=SNOWFLAKE_ACCOUNT,
     private_key=private_key,
@@ -56,24 +68,51 @@ st.session_state.conn = snowflake.connector.connect(
     role=SNOWFLAKE_ROLE
 )
 
+# Cortex Analyst のレスポンスキャッシュ（ANALYST_CACHE_DB を指定すると SQLite にも保存）
+ANALYST_CACHE = analyst_cache.get_cache(os.getenv("ANALYST_CACHE_DB"))
+# 生成 SQL の実行結果キャッシュ（SQL_RESULT_CACHE_DIR を指定すると Parquet にも保存、
+# SQL_RESULT_CACHE_CHECK_FRESHNESS=true でベーステーブルの LAST_ALTERED を確認）
+SQL_CACHE = sql_result_cache.get_cache(
+    os.getenv("SQL_RESULT_CACHE_DIR"),
+    check_freshness=os.getenv("SQL_RESULT_CACHE_CHECK_FRESHNESS", "false").lower() == "true"
+)
+
 ############################## Cortex Analyst API の呼び出し ##############################
+def list_stage(path: str) -> list:
+    """LIST の結果を dict のリストで返す"""
+    with POOL.connection() as conn:
+        with conn.cursor(DictCursor) as cur:
+            return cur.execute(f"LIST {path}").fetchall()
+
 def send_message(prompt: str) -> dict:
-    """Cortex Analyst REST API を呼び出しレスポンスを返す"""
+    """Cortex Analyst REST API を呼び出しレスポンスを返す（同じ質問・同じセマンティックモデルならキャッシュを返す）"""
+    messages = [{"role": "user", "content": [{"type": "text", "text": prompt}]}]
+    semantic_model_file = f"@{DATABASE_CORTEX}.{SCHEMA_CORTEX}.{STAGE_CORTEX}/{FILE_CORTEX}"
+    checksum = ANALYST_CACHE.stage_file_checksum(semantic_model_file, list_stage)
+    cache_key = ANALYST_CACHE.key(messages, semantic_model_file, checksum)
+    cached = ANALYST_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
     body = {
-        "messages": [{"role": "user", "content": [{"type": "text", "text": prompt}]}],
-        "semantic_model_file": f"@{DATABASE_CORTEX}.{SCHEMA_CORTEX}.{STAGE_CORTEX}/{FILE_CORTEX}",
+        "messages": messages,
+        "semantic_model_file": semantic_model_file,
     }
+    with POOL.connection() as conn:
+        token = conn.rest.token
     resp = requests.post(
         url=f"https://{HOST}/api/v2/cortex/analyst/message",
         json=body,
         headers={
-            "Authorization": f'Snowflake Token="{st.session_state.CONN.rest.token}"',
+            "Authorization": f'Snowflake Token="{token}"',
             "Content-Type": "application/json",
         },
     )
     req_id = resp.headers.get("X-Snowflake-Request-Id")
     if resp.status_code < 400:
-        return {**resp.json(), "request_id": req_id}
+        response = {**resp.json(), "request_id": req_id}
+        ANALYST_CACHE.put(cache_key, response)
+        return response
     else:
         raise Exception(f"Failed request (id: {req_id}) with status {resp.status_code}: {resp.text}")
 
@@ -93,7 +132,7 @@ def process_message(prompt: str) -> None:
 
 def display_content(content: List[dict], req_id: Optional[str] = None, msg_index: Optional[int] = None) -> None:
     """API レスポンスの内容を表示"""
-    msg_index = msg_index or len(st.session_state.messages)
+    msg_index = len(st.session_state.messages) if msg_index is None else msg_index
     if req_id:
         with st.expander("Request ID", expanded=False):
             st.markdown(req_id)
@@ -109,10 +148,26 @@ def display_content(content: List[dict], req_id: Optional[str] = None, msg_index
             with st.expander("SQL Query", expanded=False):
                 st.code(item["statement"], language="sql")
             with st.expander("Results", expanded=True):
-                with st.spinner("Running SQL..."):
-                    df = pd.read_sql(item["statement"], st.session_state.CONN)
-                    # チャート部分は省略し、テーブルのみ表示
-                    st.dataframe(df)
+                # 取得した結果はメッセージごとに保持し、ページ切り替えのリランでクエリを再実行しない
+                result_key = f"{msg_index}_result"
+                result = st.session_state.query_results.get(result_key)
+                if result is None:
+                    with st.spinner("Running SQL..."):
+                        with POOL.connection() as conn:
+                            result = result_fetch.cached_fetch_arrow(
+                                conn, item["statement"], SQL_CACHE, SNOWFLAKE_ROLE, WAREHOUSE_CORTEX,
+                                max_rows=MAX_RESULT_ROWS
+                            )
+                        POOL.log_stats()
+                    st.session_state.query_results[result_key] = result
+                # チャート部分は省略し、テーブルのみ表示（ページ単位で Arrow のまま描画）
+                num_pages = result.num_pages(RESULT_PAGE_SIZE)
+                page = 1
+                if num_pages > 1:
+                    page = st.number_input(f"Page (1-{num_pages})", min_value=1, max_value=num_pages, value=1,
+                                           key=f"{msg_index}_page")
+                st.dataframe(result.page(page - 1, RESULT_PAGE_SIZE))
+                st.caption(result.summary())
 
 ##############################　UI ##############################
 st.title("Cortex Analyst Demo App")
@@ -121,6 +176,8 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
     st.session_state.suggestions = []
     st.session_state.active_suggestion = None
+if "query_results" not in st.session_state:
+    st.session_state.query_results = {}
 
 for i, msg in enumerate(st.session_state.messages):
     with st.chat_message(msg["role"]):
@@ -1,87 +1,311 @@
-import pandas as pd
+import argparse
+import glob
+import heapq
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
-from datetime import datetime, timedelta
-import random
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# 乱数の種（再現性のため）
+DEFAULT_SEED = 42
+
+# レコード数の既定値
+DEFAULT_N_JOIN = 7000   # 入会レコード数
+DEFAULT_N_LEAVE = 3000  # 退会レコード数
 
-# 乱数の種を固定（再現性のため）
-random.seed(42)
-np.random.seed(42)
+# 乱数を生成する単位（入会レコードの行数）。ブロック（シャード）ごとに SeedSequence から分岐した独立した乱数列を使うため、
+# 出力のチャンクサイズやプロセス数、処理順に関わらず、同じ種・同じレコード数なら同じデータになる
+BLOCK_ROWS = 1_000_000
 
-# レコード数の設定
-n_join = 7000   # 入会レコード数
-n_leave = 3000  # 退会レコード数
+# シャードのファイルを日付順にマージするときに、全シャード合わせてメモリに読み込んでおく行数
+# シャードごとに読む行数はこれをシャード数で割った値（MIN_MERGE_BATCH_ROWS 以上）にし、シャード数が増えてもメモリを一定に保つ
+MERGE_BUFFER_ROWS = 4_194_304
+MIN_MERGE_BATCH_ROWS = 1024
 
 # 利用するブランドと都道府県の例
 brands = ['A', 'B', 'C']
 prefectures = ['東京都', '大阪府', '神奈川県', '愛知県', '京都府', '北海道', '福岡県']
 
-# 入会レコードの生成
-join_records = []
-for i in range(n_join):
-    # 契約id、個人idは "CT00001" のように連番で付与
-    contract_id = f"CT{i+1:05d}"
-    personal_id = contract_id  # 同じ値を使用
-    brand = random.choice(brands)
-    prefecture = random.choice(prefectures)
-    # 入会日は2024-01-01～2024-06-30の間（ランダム）
-    start_date = datetime(2024, 1, 1)
-    end_date = datetime(2024, 6, 30)
-    delta_days = (end_date - start_date).days
-    join_date = start_date + timedelta(days=random.randint(0, delta_days))
-    
-    join_records.append({
-        "日付": join_date.strftime("%Y-%m-%d"),
-        "契約id": contract_id,
-        "個人id": personal_id,
-        "ブランド": brand,
-        "都道府県": prefecture,
-        "入会フラグ": 1,
-        "退会フラグ": 0
-    })
-
-# 退会レコードの生成
-# 退会イベントを発生させる個人は join_records からランダムに選ぶ（重複なし）
-leave_indices = np.random.choice(n_join, size=n_leave, replace=False)
-leave_records = []
-for idx in leave_indices:
-    join_rec = join_records[idx]
-    join_date = datetime.strptime(join_rec["日付"], "%Y-%m-%d")
-    # 退会日は、必ず入会日の翌日以降かつ2024-07-01～2024-12-31の間
-    leave_start = max(join_date + timedelta(days=1), datetime(2024, 7, 1))
-    leave_end = datetime(2024, 12, 31)
-    if leave_start > leave_end:
-        # 万が一入会日が遅すぎる場合は退会レコードは発生させない（ここではスキップ）
-        continue
-    delta_leave = (leave_end - leave_start).days
-    leave_date = leave_start + timedelta(days=random.randint(0, delta_leave))
-    
-    leave_records.append({
-        "日付": leave_date.strftime("%Y-%m-%d"),
-        "契約id": join_rec["契約id"],
-        "個人id": join_rec["個人id"],
-        "ブランド": join_rec["ブランド"],
-        "都道府県": join_rec["都道府県"],
-        "入会フラグ": 0,
-        "退会フラグ": 1
-    })
-
-# 全レコードの結合
-all_records = join_records + leave_records
-# 日付順にソート
-df = pd.DataFrame(all_records)
-df["日付"] = pd.to_datetime(df["日付"])
-df = df.sort_values("日付").reset_index(drop=True)
-
-# 全体件数確認
-print(f"全体件数: {len(df)}")  # およそ10000件になるはず
-
-# 契約者数（累積入会 - 累積退会）の推移確認（オプション）
-df = df.sort_values("日付")
-
-# CSV として保存する場合（必要なら）
-# df.to_csv("sample_contract_data.csv", index=False, date_format="%Y-%m-%d")
-
-# データの先頭部分を表示（確認用）
-print(df.head(10))
-
-df.to_csv("sample_contract_data.csv", index=False, date_format="%Y-%m-%d")
\ No newline at end of file
+# 入会日は2024-01-01～2024-06-30、退会日は必ず入会日の翌日以降かつ2024-07-01～2024-12-31の間
+JOIN_START = np.datetime64("2024-01-01")
+JOIN_END = np.datetime64("2024-06-30")
+LEAVE_START = np.datetime64("2024-07-01")
+LEAVE_END = np.datetime64("2024-12-31")
+
+COLUMNS = ["日付", "契約id", "個人id", "ブランド", "都道府県", "入会フラグ", "退会フラグ"]
+
+# ステージに置くファイルの列名（cust_info.yml の CUST_HIST テーブルの列名に合わせる）
+TABLE_COLUMNS = {
+    "日付": "DATE",
+    "契約id": "CONTRACT_ID",
+    "個人id": "PERSONAL_ID",
+    "ブランド": "BRAND",
+    "都道府県": "PREFECTURE",
+    "入会フラグ": "JOIN_FLAG",
+    "退会フラグ": "LEAVE_FLAG",
+}
+
+# 分割出力の1ファイルあたりの行数（圧縮後に数十MB程度になり、COPY INTO で並列に読み込める）
+DEFAULT_CHUNK_ROWS = 2_000_000
+
+# PUT 先のステージ（cust_info.yml と同じデータベース・スキーマ）
+DEFAULT_STAGE_PATH = "@d_harato_db.harato_sample_cortex_demo.demo_stage/cust_hist"
+
+
+def block_count(n_join):
+    return -(-n_join // BLOCK_ROWS)
+
+
+def block_seeds(n_join, seed):
+    """ブロックごとの乱数の種（種から spawn した子。種とブロック番号だけで決まる）"""
+    return np.random.SeedSequence(seed).spawn(block_count(n_join))
+
+
+def leave_counts(n_join, n_leave, seed):
+    """
+    退会する個人を入会レコード全体から重複なしで n_leave 件選んだときの、ブロックごとの件数。
+    多変量超幾何分布で一度に決めるため、各ブロックは他のブロックを待たずに生成できる
+    """
+    block_sizes = [min(BLOCK_ROWS, n_join - block * BLOCK_ROWS) for block in range(block_count(n_join))]
+    rng = np.random.default_rng(np.random.SeedSequence(seed))
+    return rng.multivariate_hypergeometric(block_sizes, n_leave)
+
+
+def contract_ids(numbers):
+    """契約id、個人idは "CT00001" のように連番で付与"""
+    return np.char.add("CT", np.char.zfill(numbers.astype(str), 5))
+
+
+def generate_block(block, n_join, n_leave_in_block, block_seed):
+    """1ブロック分の入会・退会レコードを生成順（入会 → 退会）の DataFrame で返す"""
+    rng = np.random.default_rng(block_seed)
+    first = block * BLOCK_ROWS
+    size = min(BLOCK_ROWS, n_join - first)
+
+    # 入会レコード
+    ids = contract_ids(np.arange(first + 1, first + size + 1))
+    brand_codes = rng.integers(0, len(brands), size)
+    prefecture_codes = rng.integers(0, len(prefectures), size)
+    join_dates = JOIN_START + rng.integers(0, (JOIN_END - JOIN_START).astype(int) + 1, size)
+
+    # 退会レコード: 退会イベントを発生させる個人はブロック内からランダムに選ぶ（重複なし）
+    leavers = np.sort(rng.choice(size, n_leave_in_block, replace=False))
+    leave_start = np.maximum(join_dates[leavers] + 1, LEAVE_START)
+    leave_days = (LEAVE_END - leave_start).astype(int)
+    # 万が一入会日が遅すぎる場合は退会レコードは発生させない
+    possible = leave_days >= 0
+    leavers, leave_start, leave_days = leavers[possible], leave_start[possible], leave_days[possible]
+    leave_dates = leave_start + rng.integers(0, leave_days + 1)
+
+    rows = np.concatenate([np.arange(size), leavers])
+    return pd.DataFrame({
+        "日付": np.concatenate([join_dates, leave_dates]),
+        "契約id": ids[rows],
+        "個人id": ids[rows],  # 同じ値を使用
+        "ブランド": pd.Categorical.from_codes(brand_codes[rows], brands),
+        "都道府県": pd.Categorical.from_codes(prefecture_codes[rows], prefectures),
+        "入会フラグ": np.concatenate([np.ones(size, dtype=np.int8), np.zeros(len(leavers), dtype=np.int8)]),
+        "退会フラグ": np.concatenate([np.zeros(size, dtype=np.int8), np.ones(len(leavers), dtype=np.int8)]),
+    }, columns=COLUMNS)
+
+
+def merge_batch_rows(shard_count):
+    """マージ中にシャードごとに読み込んでおく行数（全シャード合わせて MERGE_BUFFER_ROWS 行程度）"""
+    return max(MERGE_BUFFER_ROWS // max(shard_count, 1), MIN_MERGE_BATCH_ROWS)
+
+
+def generate_shard(block, n_join, n_leave_in_block, block_seed, shard_dir, batch_rows):
+    """
+    1ブロックをシャードとして生成し、日付順に並べて Parquet に書き出す（プロセスプールのワーカーで実行する）。
+    マージで行グループ全体を展開しないよう、行グループはマージで1回に読む行数にそろえる
+    """
+    df = generate_block(block, n_join, n_leave_in_block, block_seed).sort_values("日付", kind="stable")
+    path = os.path.join(shard_dir, f"shard-{block:05d}.parquet")
+    df.to_parquet(path, index=False, row_group_size=batch_rows)
+    return path
+
+
+def generate_shards(n_join, n_leave, seed, shard_dir, workers=None):
+    """全ブロックをプロセスプールで並列に生成し、ブロック順のシャードファイルのパスを返す"""
+    counts = leave_counts(n_join, n_leave, seed)
+    batch_rows = merge_batch_rows(block_count(n_join))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(generate_shard, block, n_join, counts[block], block_seed, shard_dir, batch_rows)
+            for block, block_seed in enumerate(block_seeds(n_join, seed))
+        ]
+        return [future.result() for future in futures]
+
+
+def _shard_batches(path, batch_rows):
+    """シャードを batch_rows 行ずつ (DataFrame, 日付の整数配列) で返す"""
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+        df = batch.to_pandas()
+        yield df, df["日付"].to_numpy().astype("datetime64[D]").astype(np.int64)
+
+
+def merge_shards(paths):
+    """
+    日付順のシャードを k-way マージし、全体で日付順（同じ日付内はシャード順・生成順）の DataFrame を順に返す。
+    キーは日付なので、同じ日付が続く範囲をまとめて切り出す。全体を読み込んでソートし直すことはしない。
+    メモリに置くのは各シャードの merge_batch_rows(シャード数) 行ずつで、合計はシャード数によらず MERGE_BUFFER_ROWS 行程度
+    """
+    batch_rows = merge_batch_rows(len(paths))
+    batches = [_shard_batches(path, batch_rows) for path in paths]
+    current = [None] * len(paths)
+    heap = []
+
+    def advance(shard, df, dates, start):
+        if start >= len(dates):
+            df, dates = next(batches[shard], (None, None))
+            start = 0
+            if df is None or len(dates) == 0:
+                return
+        current[shard] = (df, dates, start)
+        heapq.heappush(heap, (dates[start], shard))
+
+    for shard in range(len(paths)):
+        advance(shard, None, (), 0)
+    while heap:
+        date, shard = heapq.heappop(heap)
+        df, dates, start = current[shard]
+        end = int(np.searchsorted(dates, date, side="right"))
+        yield df.iloc[start:end]
+        advance(shard, df, dates, end)
+
+
+def rechunk(frames, chunk_rows):
+    """DataFrame の列を chunk_rows 行ずつの DataFrame にまとめ直して返す（保持するのは書き出し前の1チャンク分だけ）"""
+    pending = []
+    pending_rows = 0
+    for df in frames:
+        start = 0
+        while start < len(df):
+            take = min(chunk_rows - pending_rows, len(df) - start)
+            pending.append(df.iloc[start:start + take])
+            pending_rows += take
+            start += take
+            if pending_rows == chunk_rows:
+                yield pd.concat(pending, ignore_index=True)
+                pending = []
+                pending_rows = 0
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
+
+
+def write_chunk(df, output_dir, index, output_format):
+    """日付順の1チャンクを、圧縮した Parquet（snappy）または gzip CSV として書き出し、そのパスを返す"""
+    df = df.rename(columns=TABLE_COLUMNS)
+    if output_format == "parquet":
+        path = os.path.join(output_dir, f"part-{index:05d}.parquet")
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.set_column(0, "DATE", table.column("DATE").cast(pa.date32()))
+        pq.write_table(table, path, compression="snappy")
+    else:
+        path = os.path.join(output_dir, f"part-{index:05d}.csv.gz")
+        df.to_csv(path, index=False, date_format="%Y-%m-%d", compression="gzip")
+    return path
+
+
+def write_chunks(chunks, output_dir, output_format):
+    """チャンクを順に書き出し、書き出したファイルのパスのリストを返す（既存の part-* は消してから書く）"""
+    os.makedirs(output_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(output_dir, "part-*")):
+        os.remove(path)
+    return [write_chunk(df, output_dir, index, output_format) for index, df in enumerate(chunks)]
+
+
+def write_csv(chunks, output):
+    """チャンクを1つのCSVファイルに順に追記し、書き出した行数を返す"""
+    rows = 0
+    for index, df in enumerate(chunks):
+        df.to_csv(output, mode="w" if index == 0 else "a", header=index == 0, index=False, date_format="%Y-%m-%d")
+        if index == 0:
+            # データの先頭部分を表示（確認用）
+            print(df.head(10))
+        rows += len(df)
+    return rows
+
+
+def put_to_stage(output_dir, stage_path, parallel=8):
+    """
+    書き出したファイルをステージへ PUT する。接続情報は app.py と同じ環境変数（.env）から読む。
+    ファイルは圧縮済みなので AUTO_COMPRESS は使わない
+    """
+    from cryptography.hazmat.primitives import serialization
+    from dotenv import load_dotenv
+    import snowflake.connector
+
+    load_dotenv(override=True)
+    passphrase = os.getenv("PRIVATE_KEY_PASSPHRASE", "")
+    private_key = serialization.load_pem_private_key(
+        os.getenv("SNOWFLAKE_PRIVATE_KEY").encode(),
+        password=passphrase.encode() if passphrase else None,
+    ).private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+    conn = snowflake.connector.connect(
+        account=os.getenv("SNOWFLAKE_ACCOUNT"),
+        user=os.getenv("SNOWFLAKE_USER"),
+        role=os.getenv("SNOWFLAKE_ROLE"),
+        private_key=private_key,
+    )
+    try:
+        pattern = os.path.join(os.path.abspath(output_dir), "part-*").replace("\\", "/")
+        cursor = conn.cursor()
+        try:
+            return cursor.execute(
+                f"PUT 'file://{pattern}' '{stage_path.rstrip('/')}/' "
+                f"AUTO_COMPRESS = FALSE OVERWRITE = TRUE PARALLEL = {parallel}"
+            ).fetchall()
+        finally:
+            cursor.close()
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="入会・退会のサンプル契約データを作成する")
+    parser.add_argument("--n-join", type=int, default=DEFAULT_N_JOIN, help="入会レコード数")
+    parser.add_argument("--n-leave", type=int, default=DEFAULT_N_LEAVE, help="退会レコード数（入会レコード数以下）")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="乱数の種")
+    parser.add_argument("--output", default="sample_contract_data.csv", help="出力するCSVファイル（--format csv のとき）")
+    parser.add_argument("--format", choices=["csv", "parquet", "csv.gz"], default="csv",
+                        help="csv: 1ファイルに全件を日付順で出力 / parquet, csv.gz: --chunk-rows 行ずつのファイルに分割して出力")
+    parser.add_argument("--output-dir", default="sample_contract_data", help="分割出力の出力先ディレクトリ")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="分割出力の1ファイルあたりの行数")
+    parser.add_argument("--workers", type=int, default=None, help="シャードを生成するプロセス数（既定: CPU数）")
+    parser.add_argument("--tmp-dir", default=None, help="シャードのファイルを一時的に置くディレクトリ")
+    parser.add_argument("--put", action="store_true", help="分割出力したファイルをステージへ PUT する")
+    parser.add_argument("--stage-path", default=DEFAULT_STAGE_PATH, help="PUT 先のステージのパス")
+    args = parser.parse_args()
+    if not 0 <= args.n_leave <= args.n_join:
+        parser.error("--n-leave は 0 以上 --n-join 以下にしてください")
+    if args.chunk_rows <= 0:
+        parser.error("--chunk-rows は 1 以上にしてください")
+    if args.put and args.format == "csv":
+        parser.error("--put は --format parquet または csv.gz と一緒に指定してください")
+
+    with tempfile.TemporaryDirectory(dir=args.tmp_dir) as shard_dir:
+        shards = generate_shards(args.n_join, args.n_leave, args.seed, shard_dir, args.workers)
+        chunks = rechunk(merge_shards(shards), args.chunk_rows)
+
+        if args.format == "csv":
+            rows = write_csv(chunks, args.output)
+            # 全体件数確認
+            print(f"全体件数: {rows}")  # 入会レコード数 + 退会レコード数になるはず
+            return
+
+        paths = write_chunks(chunks, args.output_dir, args.format)
+    print(f"{len(paths)} ファイルを {args.output_dir} に出力しました")
+    if args.put:
+        put_to_stage(args.output_dir, args.stage_path)
+        print(f"{args.stage_path} に PUT しました")
+
+if __name__ == "__main__":
+    main()
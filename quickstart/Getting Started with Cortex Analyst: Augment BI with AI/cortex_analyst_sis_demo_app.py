@@ -4,8 +4,9 @@ Cortex Analyst App
 This app allows users to interact with their data using natural language.
 """
 import json  # To handle JSON data
-import time
+import sys
 from datetime import datetime
+from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Union
 
 import _snowflake  # For interacting with Snowflake-specific APIs
@@ -16,6 +17,11 @@ from snowflake.snowpark.context import (
 )  # To interact with Snowflake sessions
 from snowflake.snowpark.exceptions import SnowparkSQLException
 
+# Shared helpers live in <repo root>/common; in Streamlit in Snowflake, upload them next to this file instead
+sys.path.append(str(Path(__file__).resolve().parents[2] / "common"))
+import analyst_cache  # Cache of Cortex Analyst responses
+import sql_result_cache  # Cache of generated SQL results
+
 # List of available semantic model paths in the format: <DATABASE>.<SCHEMA>.<STAGE>/<FILE-NAME>
 # Each path points to a YAML file defining a semantic model
 AVAILABLE_SEMANTIC_MODELS_PATHS = [
@@ -118,7 +124,6 @@ def process_user_input(prompt: str):
     # Show progress indicator inside analyst chat message while waiting for response
     with st.chat_message("analyst"):
         with st.spinner("Waiting for Analyst's response..."):
-            time.sleep(1)
             response, error_msg = get_analyst_response(st.session_state.messages)
             if error_msg is None:
                 analyst_message = {
@@ -160,10 +165,22 @@ def get_analyst_response(messages: List[Dict]) -> Tuple[Dict, Optional[str]]:
     Returns:
         Optional[Dict]: The response from the Cortex Analyst API.
     """
+    semantic_model_file = f"@{st.session_state.selected_semantic_model_path}"
+
+    # Return the cached response if the same conversation was already answered with the same semantic model file
+    cache = analyst_cache.get_cache()
+    checksum = cache.stage_file_checksum(
+        semantic_model_file, lambda path: session.sql(f"LIST {path}").collect()
+    )
+    cache_key = cache.key(messages, semantic_model_file, checksum)
+    cached_response = cache.get(cache_key)
+    if cached_response is not None:
+        return cached_response, None
+
     # Prepare the request body with the user's prompt
     request_body = {
         "messages": messages,
-        "semantic_model_file": f"@{st.session_state.selected_semantic_model_path}",
+        "semantic_model_file": semantic_model_file,
     }
 
     # Send a POST request to the Cortex Analyst API endpoint
@@ -184,6 +201,7 @@ def get_analyst_response(messages: List[Dict]) -> Tuple[Dict, Optional[str]]:
     # Check if the response is successful
     if resp["status"] < 400:
         # Return the content of the response as a JSON object
+        cache.put(cache_key, parsed_content)
         return parsed_content, None
     else:
         # Craft readable error message
@@ -245,10 +263,10 @@ def display_message(
             pass
 
 
-@st.cache_data(show_spinner=False)
 def get_query_exec_result(query: str) -> Tuple[Optional[pd.DataFrame], Optional[str]]:
     """
     Execute the SQL query and convert the results to a pandas DataFrame.
+    Results are shared across reruns and sessions through the SQL result cache.
 
     Args:
         query (str): The SQL query.
@@ -258,7 +276,7 @@ def get_query_exec_result(query: str) -> Tuple[Optional[pd.DataFrame], Optional[
     """
     global session
     try:
-        df = session.sql(query).to_pandas()
+        df = sql_result_cache.cached_snowpark_to_pandas(session, query)
         return df, None
     except SnowparkSQLException as e:
         return None, str(e)
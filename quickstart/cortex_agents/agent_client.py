@@ -0,0 +1,292 @@
+# To run a batch of prompts on the command line, enter:
+# python3 agent_client.py --prompts=<file with one question per line> --output=<results.jsonl> [--concurrency=10]
+
+"""
+Async client for the Cortex Agent, Cortex Analyst and Analyst feedback REST endpoints.
+
+All requests share one httpx.AsyncClient, so TLS connections to the account are kept alive and reused, and a
+semaphore caps how many requests are in flight at once. `run_agent_many()` sends several questions concurrently and
+streams their SSE responses side by side, which lets batch evaluation jobs run hundreds of prompts over a handful of
+connections.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+import httpx
+
+from agent_stream import DONE, AgentResponseStream
+
+logger = logging.getLogger(__name__)
+
+AGENT_ENDPOINT = "/api/v2/cortex/agent:run"
+ANALYST_ENDPOINT = "/api/v2/cortex/analyst/message"
+FEEDBACK_ENDPOINT = "/api/v2/cortex/analyst/feedback"
+DEFAULT_MODEL = "llama3.3-70b"
+
+DEFAULT_MAX_CONNECTIONS = 10  # Keep-alive connections in the shared pool
+DEFAULT_MAX_CONCURRENCY = 10  # Requests in flight at the same time
+DEFAULT_TIMEOUT = 120.0  # Seconds; agent runs can take a while to finish streaming
+
+
+def build_headers(jwt_token: str, accept: str = "application/json") -> Dict[str, str]:
+    """Headers for a key-pair JWT authenticated REST request."""
+    return {
+        'X-Snowflake-Authorization-Token-Type': 'KEYPAIR_JWT',
+        'Content-Type': 'application/json',
+        'Accept': accept,
+        'Authorization': f'Bearer {jwt_token}'
+    }
+
+
+def build_agent_payload(query: str, semantic_model_file: str, search_service: str, limit: int = 10,
+                        model: str = DEFAULT_MODEL) -> Dict:
+    """Request body for /api/v2/cortex/agent:run with one Cortex Analyst and one Cortex Search tool."""
+    return {
+        "model": model,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": query
+                    }
+                ]
+            }
+        ],
+        "tools": [
+            {
+                "tool_spec": {
+                    "type": "cortex_analyst_text_to_sql",
+                    "name": "analyst1"
+                }
+            },
+            {
+                "tool_spec": {
+                    "type": "cortex_search",
+                    "name": "search1"
+                }
+            }
+        ],
+        "tool_resources": {
+            "analyst1": {"semantic_model_file": semantic_model_file},
+            "search1": {
+                "name": search_service,
+                "max_results": limit
+            }
+        }
+    }
+
+
+class CortexAPIError(Exception):
+    """Raised when a Cortex REST endpoint returns an error status."""
+
+    def __init__(self, status_code: int, body: str):
+        super().__init__(f"Error: {status_code} - {body}")
+        self.status_code = status_code
+        self.body = body
+
+
+async def iter_sse_data(response: httpx.Response) -> AsyncIterator[str]:
+    """
+    Yield the data of each server-sent event in a streaming response.
+    Multi-line data fields are joined with newlines as described by the SSE specification.
+    """
+    data_lines = []
+    async for line in response.aiter_lines():
+        if not line:
+            if data_lines:
+                yield "\n".join(data_lines)
+                data_lines = []
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        if field == "data":
+            data_lines.append(value[1:] if value.startswith(" ") else value)
+    if data_lines:
+        yield "\n".join(data_lines)
+
+
+class AsyncCortexClient(object):
+    """
+    Shares one keep-alive connection pool between concurrent Cortex REST requests.
+
+    Usage:
+        async with AsyncCortexClient(account_url, generator.get_token, semantic_model, search_service) as client:
+            results = await client.run_agent_many(questions)
+    """
+
+    def __init__(self, account_url: str, token_provider: Callable[[], str], semantic_model_file: str,
+                 search_service: str, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, timeout: float = DEFAULT_TIMEOUT):
+        """
+        :param account_url: The account host, e.g. "myorg-myaccount.snowflakecomputing.com".
+        :param token_provider: Returns a current JWT, e.g. generate_jwt.get_jwt_generator(...).get_token.
+        :param semantic_model_file: Stage path of the semantic model used by the analyst tool.
+        :param search_service: Fully qualified name of the Cortex Search service used by the search tool.
+        :param max_connections: Size of the keep-alive connection pool.
+        :param max_concurrency: Maximum number of requests in flight at the same time.
+        :param timeout: Read timeout in seconds.
+        """
+        self.semantic_model_file = semantic_model_file
+        self.search_service = search_service
+        self._token_provider = token_provider
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = httpx.AsyncClient(
+            base_url=f"https://{account_url}",
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=10.0),
+        )
+
+    async def __aenter__(self) -> "AsyncCortexClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def stream_agent(self, query: str, limit: int = 10, model: str = DEFAULT_MODEL,
+                           on_chunk: Optional[Callable[[str], None]] = None) -> AgentResponseStream:
+        """
+        Ask the agent one question and consume its SSE response as it arrives.
+        :param on_chunk: called with each text chunk as soon as it is received
+        :return: the consumed stream, holding the text, SQL and metrics
+        """
+        payload = build_agent_payload(query, self.semantic_model_file, self.search_service, limit, model)
+        async with self._semaphore:
+            # Fetch the token only once a slot is free: a question queued behind many others could otherwise send a JWT
+            # that expired while it waited.
+            headers = build_headers(self._token_provider(), accept="text/event-stream")
+            stream = AgentResponseStream(None, started_at=time.perf_counter())
+            async with self._client.stream("POST", AGENT_ENDPOINT, headers=headers, json=payload) as response:
+                if response.status_code != 200:
+                    body = (await response.aread()).decode("utf-8", errors="replace")
+                    logger.error("Error response: %s - %s", response.status_code, body)
+                    raise CortexAPIError(response.status_code, body)
+                try:
+                    async for data in iter_sse_data(response):
+                        if data == DONE:
+                            break
+                        for chunk in stream.feed(data):
+                            if on_chunk is not None:
+                                on_chunk(chunk)
+                finally:
+                    stream.finish()
+        return stream
+
+    async def run_agent_many(self, queries: Iterable[str], limit: int = 10, model: str = DEFAULT_MODEL,
+                             on_chunk: Optional[Callable[[int, str], None]] = None) -> List[Dict]:
+        """
+        Ask several questions concurrently (bounded by max_concurrency) and stream their responses side by side.
+        A failing question does not cancel the others; its error is reported in the result instead.
+        :param on_chunk: called with (question index, text chunk) as chunks arrive
+        :return: one dict per question, in input order, with query, text, sql, metrics and error
+        """
+        async def run_one(index: int, query: str) -> Dict:
+            callback = (lambda chunk: on_chunk(index, chunk)) if on_chunk is not None else None
+            try:
+                stream = await self.stream_agent(query, limit, model, on_chunk=callback)
+            except (CortexAPIError, httpx.HTTPError) as e:
+                logger.error("Agent request failed for %r: %s", query, e)
+                return {"query": query, "text": "", "sql": "", "metrics": None, "error": str(e)}
+            metrics = stream.metrics
+            return {
+                "query": query,
+                "text": stream.text,
+                "sql": stream.sql,
+                "metrics": {
+                    "time_to_first_token": metrics.time_to_first_token,
+                    "elapsed": metrics.elapsed,
+                    "events": metrics.events,
+                    "events_per_second": metrics.events_per_second,
+                },
+                "error": None,
+            }
+
+        return await asyncio.gather(*(run_one(index, query) for index, query in enumerate(queries)))
+
+    async def analyst_message(self, messages: List[Dict], semantic_model_file: Optional[str] = None) -> Dict:
+        """
+        Send a conversation to Cortex Analyst.
+        :return: the parsed response with "request_id" added from the X-Snowflake-Request-Id header
+        """
+        body = {
+            "messages": messages,
+            "semantic_model_file": semantic_model_file or self.semantic_model_file,
+        }
+        async with self._semaphore:
+            response = await self._client.post(ANALYST_ENDPOINT, headers=build_headers(self._token_provider()),
+                                               json=body)
+        if response.status_code >= 400:
+            raise CortexAPIError(response.status_code, response.text)
+        return {**response.json(), "request_id": response.headers.get("X-Snowflake-Request-Id")}
+
+    async def submit_feedback(self, request_id: str, positive: bool, feedback_message: str = "") -> None:
+        """Send thumbs-up/down feedback for an analyst response."""
+        body = {
+            "request_id": request_id,
+            "positive": positive,
+            "feedback_message": feedback_message,
+        }
+        async with self._semaphore:
+            response = await self._client.post(FEEDBACK_ENDPOINT, headers=build_headers(self._token_provider()),
+                                               json=body)
+        if response.status_code != 200:
+            raise CortexAPIError(response.status_code, response.text)
+
+
+async def run_batch(queries: List[str], concurrency: int) -> List[Dict]:
+    from dotenv import load_dotenv
+    import generate_jwt
+
+    load_dotenv(override=True)
+    generator = generate_jwt.get_jwt_generator(
+        os.getenv("SNOWFLAKE_ACCOUNT"),
+        os.getenv("SNOWFLAKE_USER"),
+        os.getenv("RSA_PRIVATE_KEY_PATH"),
+        os.getenv("PRIVATE_KEY_PASSPHRASE", "")
+    )
+    async with AsyncCortexClient(
+        os.getenv("SNOWFLAKE_ACCOUNT_URL"),
+        generator.get_token,
+        semantic_model_file=os.getenv("SEMANTIC_MODELS", "@sales_intelligence.data.models/sales_metrics_model.yaml"),
+        search_service=os.getenv("CORTEX_SEARCH_SERVICES", "sales_intelligence.data.sales_conversation_search"),
+        max_connections=concurrency,
+        max_concurrency=concurrency,
+    ) as client:
+        return await client.run_agent_many(queries)
+
+
+def main():
+    logging.basicConfig(stream=sys.stdout, level=logging.INFO)
+    cli_parser = argparse.ArgumentParser()
+    cli_parser.add_argument('--prompts', required=True, help='Text file with one question per line.')
+    cli_parser.add_argument('--output', required=True, help='JSON Lines file to write one result per question to.')
+    cli_parser.add_argument('--concurrency', type=int, default=DEFAULT_MAX_CONCURRENCY,
+                            help='The number of questions to run at the same time.')
+    args = cli_parser.parse_args()
+
+    with open(args.prompts, encoding="utf-8") as f:
+        queries = [line.strip() for line in f if line.strip()]
+
+    started = time.perf_counter()
+    results = asyncio.run(run_batch(queries, args.concurrency))
+    with open(args.output, "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    failed = sum(1 for result in results if result["error"])
+    print(f"{len(results)} questions ({failed} failed) in {time.perf_counter() - started:.1f} s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Incremental parsing of Cortex Agent SSE responses.
+
+`AgentResponseStream` turns the raw `/api/v2/cortex/agent:run` event stream into text chunks as the events arrive,
+so the UI can render tokens and search results progressively instead of waiting for `[DONE]`. The full text is kept
+as a list of chunks and joined once, and time-to-first-token and events-per-second are measured along the way.
+"""
+import json
+import logging
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DONE = "[DONE]"
+
+# Kinds of items produced by parse_agent_event()
+TEXT = "text"
+SEARCH_RESULT = "search_result"
+SQL = "sql"
+
+
+def parse_agent_event(data: str) -> List[Tuple[str, str]]:
+    """
+    Parse the data of one SSE event into (kind, value) items in the order they appear.
+    :param data: the raw event data (a JSON document)
+    :return: a list of (TEXT | SEARCH_RESULT | SQL, value) tuples; empty if the event carries no content
+    """
+    items = []
+    payload = json.loads(data)
+    delta = payload.get('delta', {})
+    for content_item in delta.get('content', []):
+        content_type = content_item.get('type')
+
+        if content_type == "tool_results":
+            tool_results = content_item.get('tool_results', {})
+            for result in tool_results.get('content', []):
+                if result.get('type') != 'json':
+                    continue
+                result_json = result.get('json', {})
+                if result_json.get('text'):
+                    items.append((TEXT, result_json['text']))
+                for search_result in result_json.get('searchResults', []):
+                    items.append((SEARCH_RESULT, search_result.get('text', '')))
+                if result_json.get('sql'):
+                    items.append((SQL, result_json['sql']))
+        elif content_type == 'text':
+            items.append((TEXT, content_item.get('text', '')))
+    return items
+
+
+class StreamMetrics(object):
+    """
+    Timing of one streamed agent response.
+    """
+
+    def __init__(self, started_at: Optional[float] = None):
+        """
+        :param started_at: time.perf_counter() value when the request was sent; defaults to now.
+        """
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.first_token_at = None
+        self.finished_at = None
+        self.events = 0
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        """Seconds from the request to the first text chunk, or None if no text has arrived yet."""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return end - self.started_at
+
+    @property
+    def events_per_second(self) -> float:
+        elapsed = self.elapsed
+        return self.events / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        ttft = self.time_to_first_token
+        ttft_text = f"{ttft * 1000:.0f} ms" if ttft is not None else "n/a"
+        return (f"time to first token {ttft_text}, {self.events} events in {self.elapsed:.2f} s "
+                f"({self.events_per_second:.1f} events/s)")
+
+
+class AgentResponseStream(object):
+    """
+    Consumes SSE events from a Cortex Agent response and yields the text to display as soon as it arrives.
+    Search results are yielded as "\\n• <text>" chunks, matching the non-streaming response text. The generated SQL is
+    available in `sql` once the stream has been consumed.
+    """
+
+    def __init__(self, events: Optional[Iterable], started_at: Optional[float] = None,
+                 on_sql: Optional[Callable[[str], None]] = None):
+        """
+        :param events: SSE events with a `data` attribute, e.g. sseclient.SSEClient(response).events(); may be None when
+                       the caller pushes event data through feed() instead
+        :param started_at: time.perf_counter() value when the request was sent
+        :param on_sql: called with the generated SQL as soon as it arrives
+        """
+        self._events = events
+        self._on_sql = on_sql
+        self._chunks = []
+        self.sql = ""
+        self.metrics = StreamMetrics(started_at)
+
+    @property
+    def text(self) -> str:
+        """The full text received so far."""
+        return "".join(self._chunks)
+
+    def text_chunks(self) -> Iterator[str]:
+        """
+        Yield each text chunk as its event arrives; stops at `[DONE]` or when the stream ends.
+        """
+        try:
+            for event in self._events:
+                if event.data == DONE:
+                    break
+                for chunk in self.feed(event.data):
+                    yield chunk
+        finally:
+            self.finish()
+
+    def feed(self, data: str) -> List[str]:
+        """
+        Process the data of one SSE event (other than `[DONE]`).
+        :param data: the raw event data
+        :return: the text chunks carried by the event
+        """
+        logger.debug("Received SSE event: %s", data)
+        self.metrics.events += 1
+        try:
+            items = parse_agent_event(data)
+        except json.JSONDecodeError as e:
+            logger.warning("Failed to parse event data: %s", e)
+            return []
+
+        chunks = []
+        for kind, value in items:
+            if kind == SQL:
+                self.sql = value
+                if self._on_sql is not None:
+                    self._on_sql(value)
+                continue
+            chunk = f"\n• {value}" if kind == SEARCH_RESULT else value
+            if not chunk:
+                continue
+            if self.metrics.first_token_at is None:
+                self.metrics.first_token_at = time.perf_counter()
+            chunks.append(chunk)
+        self._chunks.extend(chunks)
+        return chunks
+
+    def finish(self) -> None:
+        """Mark the end of the stream and log its metrics."""
+        if self.metrics.finished_at is None:
+            self.metrics.finished_at = time.perf_counter()
+            logger.info("Agent response streamed: %s", self.metrics.summary())
+
+    def consume(self) -> Tuple[str, str]:
+        """
+        Read the whole stream without rendering it.
+        :return: the full text and the generated SQL
+        """
+        for _ in self.text_chunks():
+            pass
+        return self.text, self.sql
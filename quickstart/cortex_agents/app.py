@@ -1,13 +1,21 @@
 import streamlit as st
-import json
 import requests
 import sseclient
 import os
+import sys
+import time
+from pathlib import Path
 from dotenv import load_dotenv
 import generate_jwt
+import agent_client
+from agent_stream import AgentResponseStream
 import logging
-import pandas as pd
-import snowflake.connector
+
+# Shared helpers for the demo apps live in <repo root>/common
+sys.path.append(str(Path(__file__).resolve().parents[2] / "common"))
+import connection_pool
+import result_fetch
+import sql_result_cache
 
 load_dotenv(override=True)
 
@@ -35,6 +43,10 @@ RSA_PRIVATE_KEY_PATH = os.getenv("RSA_PRIVATE_KEY_PATH")
 PRIVATE_KEY_PASSPHRASE = os.getenv("PRIVATE_KEY_PASSPHRASE","")
 CORTEX_SEARCH_SERVICES = "sales_intelligence.data.sales_conversation_search"
 SEMANTIC_MODELS = "@sales_intelligence.data.models/sales_metrics_model.yaml"
+MAX_RESULT_ROWS = 100_000
+SQL_RESULT_CACHE_DIR = os.getenv("SQL_RESULT_CACHE_DIR")
+SQL_RESULT_CACHE_CHECK_FRESHNESS = os.getenv("SQL_RESULT_CACHE_CHECK_FRESHNESS", "false").lower() == "true"
+RESULT_PAGE_SIZE = 1_000
 
 # Custom CSS styling
 st.markdown("""
@@ -172,84 +184,63 @@ button[data-testid="stBaseButton-secondaryFormSubmit"] {
 </style>
 """, unsafe_allow_html=True)
 
+def get_connection_pool():
+    """Return the process-wide connection pool for the configured Snowflake user"""
+    return connection_pool.get_pool(
+        account=SNOWFLAKE_ACCOUNT,
+        host=SNOWFLAKE_ACCOUNT_URL,
+        user=SNOWFLAKE_USER,
+        password=SNOWFLAKE_PASSWORD,
+        role=SNOWFLAKE_ROLE,
+        warehouse=SNOWFLAKE_WAREHOUSE,
+        database=SNOWFLAKE_DATABASE,
+        schema=SNOWFLAKE_SCHEMA
+    )
+
+def get_sql_result_cache():
+    """Return the process-wide cache of generated-SQL results (Parquet on disk if SQL_RESULT_CACHE_DIR is set)"""
+    return sql_result_cache.get_cache(SQL_RESULT_CACHE_DIR, check_freshness=SQL_RESULT_CACHE_CHECK_FRESHNESS)
+
 def run_snowflake_query(query):
+    pool = get_connection_pool()
     try:
-        conn = snowflake.connector.connect(
-            account=SNOWFLAKE_ACCOUNT,
-            host=SNOWFLAKE_ACCOUNT_URL,
-            user=SNOWFLAKE_USER,
-            password=SNOWFLAKE_PASSWORD,
-            role=SNOWFLAKE_ROLE,
-            warehouse=SNOWFLAKE_WAREHOUSE,
-            database=SNOWFLAKE_DATABASE,
-            schema=SNOWFLAKE_SCHEMA
-        )
-        
-        cursor = conn.cursor()
-        cursor.execute(query)
-        columns = [col[0] for col in cursor.description]
-        results = cursor.fetchall()
-
-        cursor.close()
-        conn.close()
-        return results, columns
+        with pool.connection() as conn:
+            return result_fetch.cached_fetch_arrow(
+                conn, query, get_sql_result_cache(), SNOWFLAKE_ROLE, SNOWFLAKE_WAREHOUSE, max_rows=MAX_RESULT_ROWS
+            )
 
     except Exception as e:
         st.error(f"Error executing SQL: {str(e)}")
-        return None, None
+        return None
+    finally:
+        pool.log_stats()
+
+def display_sales_report(result):
+    """Display the query result one page at a time"""
+    st.write("### Sales Metrics Report")
+    num_pages = result.num_pages(RESULT_PAGE_SIZE)
+    page = 1
+    if num_pages > 1:
+        page = st.number_input(f"Page (1-{num_pages})", min_value=1, max_value=num_pages, value=1, key="report_page")
+    st.dataframe(result.page(page - 1, RESULT_PAGE_SIZE))
+    st.caption(result.summary())
+
+@st.cache_resource
+def get_http_session():
+    """HTTP session shared across reruns so the TLS connection to the account is kept alive"""
+    return requests.Session()
 
 def snowflake_api_call(query: str, jwt_token:str, limit: int = 10):
 
     logger.info(f"Making API call with query: {query}")
 
-    url = f"https://{SNOWFLAKE_ACCOUNT_URL}/api/v2/cortex/agent:run"
-    
-    headers = {
-        'X-Snowflake-Authorization-Token-Type': 'KEYPAIR_JWT',
-        'Content-Type': 'application/json',
-        'Accept': 'text/event-stream',
-        'Authorization': f'Bearer {jwt_token}'
-    }
-    
-    payload = {
-        "model": "llama3.3-70b",
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": query
-                    }
-                ]
-            }
-        ],
-        "tools": [
-            {
-                "tool_spec": {
-                    "type": "cortex_analyst_text_to_sql",
-                    "name": "analyst1"
-                }
-            },
-            {
-                "tool_spec": {
-                    "type": "cortex_search",
-                    "name": "search1"
-                }
-            }
-        ],
-        "tool_resources": {
-            "analyst1": {"semantic_model_file": SEMANTIC_MODELS},
-            "search1": {
-                "name": CORTEX_SEARCH_SERVICES,
-                "max_results": limit
-            }
-        }
-    }
+    url = f"https://{SNOWFLAKE_ACCOUNT_URL}{agent_client.AGENT_ENDPOINT}"
+    headers = agent_client.build_headers(jwt_token, accept='text/event-stream')
+    payload = agent_client.build_agent_payload(query, SEMANTIC_MODELS, CORTEX_SEARCH_SERVICES, limit)
     
     try:
         logger.info("Sending API request")
-        response = requests.post(
+        response = get_http_session().post(
             url=url,
             headers=headers,
             json=payload,
@@ -269,57 +260,49 @@ def snowflake_api_call(query: str, jwt_token:str, limit: int = 10):
         st.error(f"Error making request: {str(e)}")
         return None
 
-def process_sse_response(sse_client):
-    """Process SSE response"""
-    logger.info("Processing SSE response")
-    text = ""
-    sql = ""
-    
+def display_message(message):
+    """Display one chat message"""
+    with st.container():
+        if message["role"] == "user":
+            st.markdown("**You:**")
+        else:
+            st.markdown("**Assistant:**")
+        st.markdown(message["content"].replace("•", "\n\n-"))
+        st.markdown("---")
+
+def stream_sse_response(sse_client, started_at):
+    """Render the agent response while its SSE events arrive and return the full text and SQL"""
+    logger.info("Streaming SSE response")
     if not sse_client:
-        return text, sql
-        
+        return "", ""
+
+    with st.container():
+        st.markdown("**Assistant:**")
+        text_area = st.empty()
+        metrics_area = st.empty()
+        st.markdown("---")
+    sql_area = st.empty()
+
+    def show_sql(sql):
+        with sql_area.container():
+            st.markdown("### Generated SQL")
+            st.code(sql, language="sql")
+
+    stream = AgentResponseStream(sse_client.events(), started_at=started_at, on_sql=show_sql)
     try:
-        for event in sse_client.events():
-            logger.debug(f"Received SSE event: {event.data}")
-            if event.data == "[DONE]":
-                break
-                
-            try:
-                data = json.loads(event.data)
-                
-                if 'delta' in data and 'content' in data['delta']:
-                    for content_item in data['delta']['content']:
-                        content_type = content_item.get('type')
-                        
-                        if content_type == "tool_results":
-                            tool_results = content_item.get('tool_results', {})
-                            if 'content' in tool_results:
-                                for result in tool_results['content']:
-                                    if result.get('type') == 'json':
-                                        logger.debug(f"JSON result: {result}")
-                                        text += result.get('json', {}).get('text', '')
-                                        search_results = result.get('json', {}).get('searchResults', [])
-                                        for search_result in search_results:
-                                            text += f"\n• {search_result.get('text', '')}"
-                                        sql = result.get('json', {}).get('sql', '')
-                        if content_type == 'text':
-                            text += content_item.get('text', '')
-                            
-            except json.JSONDecodeError as e:
-                logger.warning(f"Failed to parse event data: {str(e)}")
-                continue
-                
+        with text_area.container():
+            st.write_stream(chunk.replace("•", "\n\n-") for chunk in stream.text_chunks())
     except Exception as e:
         logger.error(f"Error processing events: {str(e)}", exc_info=True)
         st.error(f"Error processing events: {str(e)}")
-        
-    return text, sql
+    metrics_area.caption(stream.metrics.summary())
+    return stream.text, stream.sql
 
 def main():
     st.title("Intelligent Sales Assistant")
 
-    # Initialize JWT Generator
-    jwt_token = generate_jwt.JWTGenerator(
+    # Get the process-wide JWT generator (the key is parsed once and the token is renewed in the background)
+    jwt_token = generate_jwt.get_jwt_generator(
         SNOWFLAKE_ACCOUNT,
         SNOWFLAKE_USER,
         RSA_PRIVATE_KEY_PATH,
@@ -330,8 +313,17 @@ def main():
     with st.sidebar:
         if st.button("New Conversation", key="new_chat"):
             st.session_state.messages = []
+            st.session_state.pop("last_sql", None)
+            st.session_state.pop("sales_report", None)
             st.rerun()
 
+        pool_stats = get_connection_pool().stats()
+        if pool_stats["checkouts"]:
+            st.caption(
+                f"Connection pool: hit rate {pool_stats['hit_rate']:.0%}, "
+                f"avg wait {pool_stats['avg_wait_ms']:.1f} ms, open {pool_stats['open']}"
+            )
+
     # Initialize session state
     if 'messages' not in st.session_state:
         st.session_state.messages = []
@@ -350,35 +342,36 @@ def main():
         # Add user message to chat
         st.session_state.messages.append({"role": "user", "content": query})
         
-        # Get response from API
+        # Display chat history
+        for message in st.session_state.messages:
+            logger.info(f"Message: {message}")
+            display_message(message)
+
+        # Get response from API and render it as it streams in
         with st.spinner("Processing your request..."):
+            started_at = time.perf_counter()
             sse_client = snowflake_api_call(query, jwt_token)
-            text, sql = process_sse_response(sse_client)
+            text, sql = stream_sse_response(sse_client, started_at)
             
             # Add assistant response to chat
             if text:
                 st.session_state.messages.append({"role": "assistant", "content": text})
-
-            # Display chat history
-            for message in st.session_state.messages:
-                logger.info(f"Message: {message}")
-                with st.container():
-                    if message["role"] == "user":
-                        st.markdown("**You:**")
-                    else:
-                        st.markdown("**Assistant:**")
-                    st.markdown(message["content"].replace("•", "\n\n-"))
-                    st.markdown("---")
             
-            # Display SQL if present
-            if sql:
-                st.markdown("### Generated SQL")
-                st.code(sql, language="sql")
-                sales_results, column_names = run_snowflake_query(sql)
-                if sales_results:
-                    df = pd.DataFrame(sales_results, columns=column_names)
-                    st.write("### Sales Metrics Report")
-                    st.dataframe(df)
+            # Run SQL if present; the SQL and its result are kept so that paging through it does not re-run the query
+            st.session_state.last_sql = sql
+            st.session_state.sales_report = run_snowflake_query(sql) if sql else None
+            st.session_state.pop("report_page", None)
+    else:
+        # Display chat history and the last generated SQL (also on reruns triggered by the report's page selector)
+        for message in st.session_state.messages:
+            display_message(message)
+        if st.session_state.get("last_sql"):
+            st.markdown("### Generated SQL")
+            st.code(st.session_state.last_sql, language="sql")
+
+    # Display the latest query result
+    if st.session_state.get("sales_report") is not None and st.session_state.sales_report.num_rows:
+        display_sales_report(st.session_state.sales_report)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
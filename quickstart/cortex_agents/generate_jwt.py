@@ -11,7 +11,9 @@ import base64
 from getpass import getpass
 import hashlib
 import logging
+import os
 import sys
+import threading
 
 # This class relies on the PyJWT module (https://pypi.org/project/PyJWT/).
 import jwt
@@ -35,6 +37,90 @@ SUBJECT = "sub"
 def get_private_key_passphrase():
     return getpass('Passphrase for private key: ')
 
+# Process-wide caches so that Streamlit reruns and concurrent sessions share one parsed key and one signer.
+# _private_keys maps the absolute key path to (mtime, private key, public key fingerprint).
+# _generators maps (account, user, key path, public key fingerprint, lifetime, renewal delay) to the shared JWTGenerator.
+_private_keys = {}
+_generators = {}
+_cache_lock = threading.RLock()  # Re-entrant: JWTGenerator() loads the key while get_jwt_generator() holds it
+
+def load_private_key(private_key_file_path: Text, private_key_passphrase: Text):
+    """
+    Load the private key from the specified file, reusing the parsed key until the file changes on disk.
+    :param private_key_file_path: Path to the private key file used for signing the JWTs.
+    :param private_key_passphrase: Passphrase used if the private key is encrypted.
+    :return: a tuple of the private key and its public key fingerprint
+    """
+    path = os.path.abspath(private_key_file_path)
+    mtime = os.path.getmtime(path)
+    with _cache_lock:
+        cached = _private_keys.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1], cached[2]
+
+        with open(path, 'rb') as pem_in:
+            pemlines = pem_in.read()
+            try:
+                # Try to access the private key without a passphrase.
+                private_key = load_pem_private_key(pemlines, None, default_backend())
+            except TypeError:
+                # If that fails, provide the specified passphrase.
+                private_key = load_pem_private_key(pemlines, (private_key_passphrase or '').encode(), default_backend())
+
+        public_key_fp = calculate_public_key_fingerprint(private_key)
+        _private_keys[path] = (mtime, private_key, public_key_fp)
+        return private_key, public_key_fp
+
+def calculate_public_key_fingerprint(private_key) -> Text:
+    """
+    Given a private key, return the public key fingerprint.
+    :param private_key: private key object
+    :return: public key fingerprint
+    """
+    # Get the raw bytes of public key.
+    public_key_raw = private_key.public_key().public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo)
+
+    # Get the sha256 hash of the raw bytes.
+    sha256hash = hashlib.sha256()
+    sha256hash.update(public_key_raw)
+
+    # Base64-encode the value and prepend the prefix 'SHA256:'.
+    public_key_fp = 'SHA256:' + base64.b64encode(sha256hash.digest()).decode('utf-8')
+    logger.info("Public key fingerprint is %s", public_key_fp)
+
+    return public_key_fp
+
+def get_jwt_generator(account: Text, user: Text, private_key_file_path: Text, private_key_passphrase: Text,
+                      lifetime: timedelta = None, renewal_delay: timedelta = None,
+                      background_refresh: bool = True) -> "JWTGenerator":
+    """
+    Return the process-wide JWTGenerator for the given account, user and key, creating it on first use.
+    The generator is shared by every caller with the same account, user, key and token timings, so the key is parsed
+    once and the token is only signed when it needs renewing. When the key file is replaced, the generators that still
+    sign with the old key are stopped and dropped.
+    :param background_refresh: Renew the token on a background thread before the renewal time is reached.
+    :return: the shared JWTGenerator
+    """
+    path = os.path.abspath(private_key_file_path)
+    _, public_key_fp = load_private_key(path, private_key_passphrase)
+    lifetime = lifetime or JWTGenerator.LIFETIME
+    renewal_delay = renewal_delay or JWTGenerator.RENEWAL_DELTA
+    owner = (JWTGenerator.prepare_account_name_for_jwt(account), user.upper(), path)
+    cache_key = owner + (public_key_fp, lifetime, renewal_delay)
+    with _cache_lock:
+        stale = [key for key in _generators if key[:3] == owner and key[3] != public_key_fp]
+        stale_generators = [_generators.pop(key) for key in stale]
+        generator = _generators.get(cache_key)
+        if generator is None:
+            generator = JWTGenerator(account, user, path, private_key_passphrase, lifetime, renewal_delay)
+            _generators[cache_key] = generator
+    # Join the old refresh threads outside the cache lock so other callers are not blocked meanwhile.
+    for stale_generator in stale_generators:
+        stale_generator.stop_background_refresh()
+    if background_refresh:
+        generator.start_background_refresh()
+    return generator
+
 class JWTGenerator(object):
     """
     Creates and signs a JWT with the specified private key file, username, and account identifier. The JWTGenerator keeps the
@@ -42,6 +128,8 @@ class JWTGenerator(object):
     """
     LIFETIME = timedelta(minutes=59)  # The tokens will have a 59 minute lifetime
     RENEWAL_DELTA = timedelta(minutes=54)  # Tokens will be renewed after 54 minutes
+    REFRESH_AHEAD = timedelta(minutes=1)  # The background refresher renews this long before the renewal time
+    REFRESH_RETRY = timedelta(seconds=30)  # Wait this long before retrying a failed background refresh
     ALGORITHM = "RS256"  # Tokens will be generated using RSA with SHA256
 
     def __init__(self, account: Text, user: Text, private_key_file_path: Text, private_key_passphrase: Text,
@@ -70,18 +158,15 @@ class JWTGenerator(object):
         self.private_key_file_path = private_key_file_path
         self.renew_time = datetime.now(timezone.utc)
         self.token = None
+        self._lock = threading.Lock()
+        self._refresher = None
+        self._stop_refresh = threading.Event()
 
-        # Load the private key from the specified file.
-        with open(self.private_key_file_path, 'rb') as pem_in:
-            pemlines = pem_in.read()
-            try:
-                # Try to access the private key without a passphrase.
-                self.private_key = load_pem_private_key(pemlines, None, default_backend())
-            except TypeError:
-                # If that fails, provide the passphrase returned from get_private_key_passphrase().
-                self.private_key = load_pem_private_key(pemlines, private_key_passphrase.encode(), default_backend())
+        # Load the private key from the specified file (parsed once per process) and keep its fingerprint.
+        self.private_key, self.public_key_fp = load_private_key(self.private_key_file_path, private_key_passphrase)
 
-    def prepare_account_name_for_jwt(self, raw_account: Text) -> Text:
+    @staticmethod
+    def prepare_account_name_for_jwt(raw_account: Text) -> Text:
         """
         Prepare the account identifier for use in the JWT.
         For the JWT, the account identifier must not include the subdomain or any region or cloud provider information.
@@ -108,44 +193,90 @@ class JWTGenerator(object):
         specified renewal time has passed.
         :return: the new token
         """
-        now = datetime.now(timezone.utc)  # Fetch the current time
+        # Fast path: hand out the current token without taking the lock.
+        token = self.token
+        if token is not None and datetime.now(timezone.utc) < self.renew_time:
+            return token
 
-        # If the token has expired or doesn't exist, regenerate the token.
-        if self.token is None or self.renew_time <= now:
-            logger.info("Generating a new token because the present time (%s) is later than the renewal time (%s)",
-                        now, self.renew_time)
-            # Calculate the next time we need to renew the token.
-            self.renew_time = now + self.renewal_delay
+        with self._lock:
+            now = datetime.now(timezone.utc)  # Fetch the current time
+            # If the token has expired or doesn't exist, regenerate the token.
+            if self.token is None or self.renew_time <= now:
+                logger.info("Generating a new token because the present time (%s) is later than the renewal time (%s)",
+                            now, self.renew_time)
+                self._generate_token(now)
+            return self.token
 
-            # Prepare the fields for the payload.
-            # Generate the public key fingerprint for the issuer in the payload.
-            public_key_fp = self.calculate_public_key_fingerprint(self.private_key)
+    def _generate_token(self, now: datetime) -> None:
+        """
+        Sign a new JWT and store it together with the next renewal time. The caller must hold self._lock.
+        :param now: the issue time of the new token
+        """
+        # Create our payload
+        payload = {
+            # Set the issuer to the fully qualified username concatenated with the public key fingerprint.
+            ISSUER: self.qualified_username + '.' + self.public_key_fp,
 
-            # Create our payload
-            payload = {
-                # Set the issuer to the fully qualified username concatenated with the public key fingerprint.
-                ISSUER: self.qualified_username + '.' + public_key_fp,
+            # Set the subject to the fully qualified username.
+            SUBJECT: self.qualified_username,
 
-                # Set the subject to the fully qualified username.
-                SUBJECT: self.qualified_username,
+            # Set the issue time to now.
+            ISSUE_TIME: now,
 
-                # Set the issue time to now.
-                ISSUE_TIME: now,
+            # Set the expiration time, based on the lifetime specified for this object.
+            EXPIRE_TIME: now + self.lifetime
+        }
 
-                # Set the expiration time, based on the lifetime specified for this object.
-                EXPIRE_TIME: now + self.lifetime
-            }
+        # Regenerate the actual token
+        token = jwt.encode(payload, key=self.private_key, algorithm=JWTGenerator.ALGORITHM)
+        # If you are using a version of PyJWT prior to 2.0, jwt.encode returns a byte string, rather than a string.
+        # If the token is a byte string, convert it to a string.
+        if isinstance(token, bytes):
+          token = token.decode('utf-8')
+        self.token = token
+        # Calculate the next time we need to renew the token.
+        self.renew_time = now + self.renewal_delay
+        logger.info("Generated a JWT with the following payload: %s", payload)
 
-            # Regenerate the actual token
-            token = jwt.encode(payload, key=self.private_key, algorithm=JWTGenerator.ALGORITHM)
-            # If you are using a version of PyJWT prior to 2.0, jwt.encode returns a byte string, rather than a string.
-            # If the token is a byte string, convert it to a string.
-            if isinstance(token, bytes):
-              token = token.decode('utf-8')
-            self.token = token
-            logger.info("Generated a JWT with the following payload: %s", jwt.decode(self.token, key=self.private_key.public_key(), algorithms=[JWTGenerator.ALGORITHM]))
+    def start_background_refresh(self) -> None:
+        """
+        Start a daemon thread that renews the token REFRESH_AHEAD before the renewal time, so callers of get_token()
+        never wait for RSA signing. Calling this more than once has no effect.
+        """
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._stop_refresh.clear()
+            self._refresher = threading.Thread(target=self._refresh_loop, name="jwt-refresh-" + self.qualified_username,
+                                               daemon=True)
+            self._refresher.start()
+
+    def stop_background_refresh(self) -> None:
+        """
+        Stop the background refresh thread started by start_background_refresh().
+        """
+        self._stop_refresh.set()
+        refresher, self._refresher = self._refresher, None
+        if refresher is not None:
+            refresher.join()
 
-        return self.token
+    def _refresh_loop(self) -> None:
+        while True:
+            if self.token is None:
+                wait = timedelta(0)
+            else:
+                # Never refresh earlier than half way through the renewal delay.
+                ahead = min(self.REFRESH_AHEAD, self.renewal_delay / 2)
+                wait = self.renew_time - ahead - datetime.now(timezone.utc)
+            if self._stop_refresh.wait(max(wait.total_seconds(), 0)):
+                return
+            try:
+                with self._lock:
+                    self._generate_token(datetime.now(timezone.utc))
+            except Exception:
+                logger.error("Background JWT refresh failed; retrying in %s", self.REFRESH_RETRY, exc_info=True)
+                if self._stop_refresh.wait(self.REFRESH_RETRY.total_seconds()):
+                    return
 
     def calculate_public_key_fingerprint(self, private_key: Text) -> Text:
         """
@@ -153,18 +284,7 @@ class JWTGenerator(object):
         :param private_key: private key string
         :return: public key fingerprint
         """
-        # Get the raw bytes of public key.
-        public_key_raw = private_key.public_key().public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo)
-
-        # Get the sha256 hash of the raw bytes.
-        sha256hash = hashlib.sha256()
-        sha256hash.update(public_key_raw)
-
-        # Base64-encode the value and prepend the prefix 'SHA256:'.
-        public_key_fp = 'SHA256:' + base64.b64encode(sha256hash.digest()).decode('utf-8')
-        logger.info("Public key fingerprint is %s", public_key_fp)
-
-        return public_key_fp
+        return calculate_public_key_fingerprint(private_key)
 
 def main():
     logging.basicConfig(stream=sys.stdout, level=logging.INFO)
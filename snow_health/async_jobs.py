@@ -0,0 +1,74 @@
+import threading
+import time
+import streamlit as st
+
+# 実行状況を確認する間隔（秒）
+POLL_INTERVAL_SECONDS = 1.0
+
+# 投入済みのクエリ（名前, SQL） → (クエリID, 投入時刻)
+# モジュールはスクリプトの再実行をまたいで残るため、再実行や別のセッションでも実行中のクエリを使い回せる
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+# クエリを非同期で投入する。TTL内に同じクエリを投入済みなら、そのクエリIDのジョブを返す
+def submit(session, name, sql, ttl_seconds):
+    key = (name, sql)
+    now = time.time()
+    with _jobs_lock:
+        submitted = _jobs.get(key)
+        if submitted is not None and now - submitted[1] < ttl_seconds:
+            return session.create_async_job(submitted[0])
+        job = session.sql(sql).collect_nowait()
+        _jobs[key] = (job.query_id, now)
+        return job
+
+# 実行中のクエリをキャンセルし、投入済みの記録を消す（次回は新しく投入する）
+def cancel_all(session):
+    with _jobs_lock:
+        query_ids = [query_id for query_id, _ in _jobs.values()]
+        _jobs.clear()
+    for query_id in query_ids:
+        job = session.create_async_job(query_id)
+        if not job.is_done():
+            job.cancel()
+
+# 投入済みのクエリの記録を消す（失敗したクエリを次回投入し直すため）
+def forget(query_id):
+    with _jobs_lock:
+        for key, (submitted_query_id, _) in list(_jobs.items()):
+            if submitted_query_id == query_id:
+                del _jobs[key]
+
+# 結果はクエリIDごとにキャッシュする（Snowflake側でも結果は24時間保持される）
+@st.cache_data(max_entries=32, show_spinner=False)
+def _fetch_result(_session, query_id):
+    return _session.create_async_job(query_id).result("pandas")
+
+# 実行済みクエリの結果を DataFrame で返す。失敗したクエリは記録を消して次回投入し直す
+def fetch_result(session, query_id):
+    try:
+        return _fetch_result(session, query_id)
+    except Exception:
+        forget(query_id)
+        raise
+
+# 複数のクエリを同時に投入し、進捗を表示しながら完了を待って {名前: クエリID} を返す
+# 待っている間に画面を操作すると Streamlit がスクリプトを中断するが、クエリは実行を続け、再実行時に使い回される
+def run_all(session, queries, ttl_seconds, label):
+    jobs = {name: submit(session, name, sql, ttl_seconds) for name, sql in queries.items()}
+    started = time.time()
+    progress = None
+    while True:
+        done = sum(1 for job in jobs.values() if job.is_done())
+        if done == len(jobs):
+            break
+        if progress is None:
+            progress = st.progress(0.0)
+        progress.progress(
+            done / len(jobs),
+            text=f"{label}（{done}/{len(jobs)} 件完了、{time.time() - started:.0f}秒経過）",
+        )
+        time.sleep(POLL_INTERVAL_SECONDS)
+    if progress is not None:
+        progress.empty()
+    return {name: job.query_id for name, job in jobs.items()}
@@ -0,0 +1,100 @@
+# ブラウザを使わずに未使用オブジェクトを調べる場合（複数アカウントを並列に実行し、結果をファイルに出力する）:
+# python3 checks.py --connections account_a.json account_b.json [--days 90] [--output-dir output] [--format parquet|csv] [--refresh]
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from snowflake_utils import create_session, load_sql, run_sql_file
+
+SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql")
+
+# 未使用オブジェクトを取得するSQL（最終アクセスが days 日より前、またはアクセス履歴なし）
+def unused_objects_sql(days):
+    return load_sql(os.path.join(SQL_DIR, "unused_objects.sql")).replace("current_date - 30", f"current_date - {days}")
+
+# アクセス履歴サマリー（object_last_access）を用意する。空（未作成）なら access_history から初回作成し、refresh なら差分で更新する
+def prepare_object_last_access(session, refresh=False):
+    run_sql_file(session, os.path.join(SQL_DIR, "object_last_access_setup.sql"))
+    if refresh or session.sql("select count(*) from object_last_access").collect()[0][0] == 0:
+        session.sql(load_sql(os.path.join(SQL_DIR, "refresh_object_last_access.sql"))).collect()
+
+# 未使用のテーブル・ビューを DataFrame で返す
+def scan_unused_objects(session, days):
+    return session.sql(unused_objects_sql(days)).to_pandas()
+
+# 結果の出力ファイル名などに使うラベル（アカウント名 + connection.json の絶対パスのハッシュ）
+# 別のディレクトリにある同名の connection.json や、同じアカウントの別の接続情報でも重ならない
+def account_label(connection_file):
+    with open(connection_file) as f:
+        account = json.load(f).get("account", "account")
+    path_hash = hashlib.sha1(os.path.abspath(connection_file).encode("utf-8")).hexdigest()[:8]
+    return f"{account}_{path_hash}"
+
+# 1アカウント分: connection.json で接続し、未使用オブジェクトを取得する
+def run_account(connection_file, days, refresh=False):
+    session = create_session(connection_file)
+    try:
+        prepare_object_last_access(session, refresh)
+        unused_objects_df = scan_unused_objects(session, days)
+    finally:
+        session.close()
+    return unused_objects_df.assign(
+        ACCOUNT=account_label(connection_file),
+        CONNECTION_FILE=os.path.abspath(connection_file),
+    )
+
+# 複数アカウントを1アカウント1ワーカーで並列に実行し、{connection.json のパス: DataFrame または例外} を返す
+# 1アカウントの失敗で他のアカウントは止めない
+def run_accounts(connection_files, days, refresh=False):
+    with ThreadPoolExecutor(max_workers=max(1, len(connection_files))) as executor:
+        futures = {
+            connection_file: executor.submit(run_account, connection_file, days, refresh)
+            for connection_file in connection_files
+        }
+        results = {}
+        for connection_file, future in futures.items():
+            try:
+                results[connection_file] = future.result()
+            except Exception as e:
+                results[connection_file] = e
+        return results
+
+# 結果をアカウントごとに1ファイルずつ出力し、出力したパスを返す
+# 未使用オブジェクトがなくても列だけのファイルで上書きし、前回の結果が残らないようにする
+def write_result(unused_objects_df, label, output_dir, output_format):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"unused_objects_{label}.{output_format}")
+    if output_format == "parquet":
+        unused_objects_df.to_parquet(path, index=False)
+    else:
+        unused_objects_df.to_csv(path, index=False)
+    return path
+
+def main():
+    cli_parser = argparse.ArgumentParser(description="未使用のテーブル・ビューを複数アカウントについて調べ、ファイルに出力する")
+    cli_parser.add_argument("--connections", nargs="+", required=True, help="アカウントごとの connection.json")
+    cli_parser.add_argument("--days", type=int, default=30, help="未使用とみなす期間（日数）")
+    cli_parser.add_argument("--output-dir", default="output", help="出力先ディレクトリ")
+    cli_parser.add_argument("--format", choices=["parquet", "csv"], default="parquet", help="出力形式")
+    cli_parser.add_argument("--refresh", action="store_true", help="実行前にアクセス履歴サマリーを更新する")
+    args = cli_parser.parse_args()
+
+    started = time.perf_counter()
+    results = run_accounts(args.connections, args.days, args.refresh)
+    failed = 0
+    for connection_file, result in results.items():
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"{connection_file}: 失敗しました: {result}")
+        else:
+            path = write_result(result, account_label(connection_file), args.output_dir, args.format)
+            print(f"{connection_file}: {len(result)} 件 -> {path}")
+    print(f"{len(results)} アカウント（失敗 {failed} 件）: {time.perf_counter() - started:.1f}秒")
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,59 +1,220 @@
-import json
-from snowflake.snowpark.session import Session
-from cryptography.hazmat.primitives import serialization
+import pandas as pd
 import streamlit as st
+import async_jobs
+import checks
+import paging
+import savings
+from snowflake_session import get_refresh_session, get_session
+from snowflake_utils import load_sql, run_sql_file
 
-# JSONファイルを読み込む
-with open("./connection.json") as f:
-    snowflake_connection_cfg = json.load(f)
+session = get_session()
 
-# 秘密鍵ファイルの読み込みとデコード
-private_key_path = snowflake_connection_cfg["private_key"]
-with open(private_key_path, "rb") as key_file:
-    private_key = serialization.load_pem_private_key(
-        key_file.read(),
-        password=None
+# アクセス履歴サマリー（object_last_access）を更新するタスク
+REFRESH_TASK_NAME = "refresh_object_last_access"
+REFRESH_TASK_SCHEDULE = "USING CRON 0 * * * * UTC"  # 毎時
+
+# 未使用期間の選択肢（日数）と、取得結果をキャッシュする秒数
+DAYS_OPTIONS = [30, 90, 180, 360]
+CACHE_TTL_SECONDS = 3600
+
+# access_history の差分でアクセス履歴サマリーを更新する
+def refresh_object_last_access():
+    session.sql(load_sql("sql/refresh_object_last_access.sql")).collect()
+
+# アクセス履歴サマリーを定期的に更新するタスク（サーバーレス）を作成・開始する
+def create_refresh_task():
+    merge_statement = "\n".join(
+        line for line in load_sql("sql/refresh_object_last_access.sql").splitlines()
+        if not line.lstrip().startswith("--")
+    ).strip().rstrip(";")
+    session.sql(
+        f"create or replace task {REFRESH_TASK_NAME} schedule = '{REFRESH_TASK_SCHEDULE}' as\n{merge_statement}"
+    ).collect()
+    session.sql(f"alter task {REFRESH_TASK_NAME} resume").collect()
+
+# access_history の差分でカラム単位の利用状況（column_usage）を更新する（トランザクションを使うため専用のセッションで実行する）
+def refresh_column_usage():
+    run_sql_file(get_refresh_session(), "sql/refresh_column_usage.sql")
+
+# 未使用オブジェクトとカラムの利用状況を同時に非同期で実行し、クエリIDをTTLの間使い回す
+# 未使用オブジェクトは最も短い期間（= 最も広い対象）で1回だけ実行し、期間の絞り込みとページングはその結果（RESULT_SCAN）に対して行う
+def fetch_health_checks(min_days):
+    queries = {
+        "unused_objects": checks.unused_objects_sql(min_days),
+        "column_usage_by_table": load_sql("sql/column_usage_by_table.sql"),
+    }
+    return async_jobs.run_all(session, queries, CACHE_TTL_SECONDS, "アカウントの利用状況を集計しています")
+
+# 未使用オブジェクトのデータベース → スキーマ → オーナーロールごとの件数・ストレージ量（GROUPING SETS で1回に集計）
+@st.cache_data(max_entries=64, show_spinner="未使用オブジェクトを集計しています...")
+def fetch_unused_object_rollups(_session, query_id, days):
+    query = load_sql("sql/unused_object_rollups.sql").format(
+        result_scan=paging.result_scan(query_id), unused_condition=paging.unused_condition(days)
     )
+    return paging.fetch_arrow_dataframe(_session, query)
+
+# 未使用テーブルのストレージの内訳（削減額の試算に必要な列だけを取得する）
+@st.cache_data(max_entries=64, show_spinner="ストレージの内訳を取得しています...")
+def fetch_unused_table_storage(_session, query_id, days):
+    return paging.fetch_arrow_dataframe(
+        _session,
+        "select fully_qualified_table_name, active_tb, time_travel_tb, failsafe_tb, retained_for_clone_tb, retention_time "
+        f"from {paging.result_scan(query_id)} "
+        f"where object_domain = 'Table' and {paging.unused_condition(days)}",
+    )
+
+# 1テーブル分のカラムごとの利用状況
+@st.cache_data(ttl=CACHE_TTL_SECONDS)
+def fetch_column_usage_detail(table_id):
+    return session.sql(load_sql("sql/column_usage_detail.sql"), params=[table_id]).to_pandas()
+
+# 最終アクセスから days 日より前（またはアクセス履歴なし）の行を True とする
+def is_unused(df, days):
+    days_since = df["DAYS_SINCE_LAST_ACCESS"].to_numpy(dtype="float64", na_value=float("nan"))
+    return pd.isna(days_since) | (days_since > days)
+
+# カラム単位の利用状況を集計済みか（上限が記録されているか）
+def column_usage_ready():
+    return session.sql("select count(*) from column_usage_watermark").collect()[0][0] > 0
 
-# Snowflakeに接続
-snowflake_connection_cfg["private_key"] = private_key
-session = Session.builder.configs(snowflake_connection_cfg).create()
+# アクセス履歴サマリーの件数と最終アクセス日時（ハイウォーターマーク）
+def object_last_access_status():
+    return session.sql("select count(*), max(last_accessed_at) from object_last_access").collect()[0]
 
-# SQLファイルを読み込む関数
-def load_sql(file_path):
-    with open(file_path, "r") as file:
-        return file.read()
+# サマリーテーブルを用意し、空なら access_history から初回作成する
+if "object_last_access_ready" not in st.session_state:
+    run_sql_file(session, "sql/object_last_access_setup.sql")
+    run_sql_file(session, "sql/column_usage_setup.sql")
+    if object_last_access_status()[0] == 0:
+        with st.spinner("アクセス履歴サマリーを初回作成しています..."):
+            refresh_object_last_access()
+    if not column_usage_ready():
+        with st.spinner("カラム単位の利用状況を初回集計しています..."):
+            refresh_column_usage()
+    st.session_state.object_last_access_ready = True
 
 # Streamlit UI
 st.title("未使用テーブル・ビューの特定")
 
+with st.sidebar:
+    st.subheader("アクセス履歴サマリー")
+    if st.button("最新の access_history で更新"):
+        # 更新前のサマリーを読んでいる実行中のクエリは不要になるため止める
+        async_jobs.cancel_all(session)
+        with st.spinner("更新しています..."):
+            refresh_object_last_access()
+            refresh_column_usage()
+        fetch_column_usage_detail.clear()
+    if st.button("実行中のクエリをキャンセル"):
+        async_jobs.cancel_all(session)
+        st.stop()
+    if st.button(f"定期更新タスクを作成（{REFRESH_TASK_SCHEDULE}）"):
+        create_refresh_task()
+        st.success(f"タスク {REFRESH_TASK_NAME} を作成しました")
+    summary_count, high_water_mark = object_last_access_status()
+    st.caption(f"{summary_count} オブジェクト / 最終アクセス: {high_water_mark}")
+
 # 日数選択（30, 90, 180, 360日）
 days_option = st.radio(
     "未使用の期間（日数）を選択してください",
-    [30, 90, 180, 360],
+    DAYS_OPTIONS,
     index=0
 )
 
 st.write(f"現在の設定: **{days_option}日** 未使用のテーブル・ビューを表示")
 
-# クエリ読み込み & 置換
-unused_tables_query = load_sql("sql/unused_tables.sql").replace("current_date - 30", f"current_date - {days_option}")
-unused_views_query = load_sql("sql/unused_views.sql").replace("current_date - 30", f"current_date - {days_option}")
-
-# 未使用テーブルの取得
-unused_tables_df = session.sql(unused_tables_query).collect()
-unused_tables_count = len(unused_tables_df)
+health_checks = fetch_health_checks(min(DAYS_OPTIONS))
 
-# 未使用ビューの取得
-unused_views_df = session.sql(unused_views_query).collect()
-unused_views_count = len(unused_views_df)
+# テーブル・ビューの件数と表示中のページだけを取得する（全件をブラウザに送らない）
+unused_objects_query_id = health_checks["unused_objects"]
+try:
+    unused_object_counts = paging.count_unused_objects(session, unused_objects_query_id, days_option)
+except Exception:
+    # 失敗・キャンセルされたクエリの結果は読めないため、次回は投入し直す
+    async_jobs.forget(unused_objects_query_id)
+    raise
 
 # 未使用テーブル
+unused_tables_count = unused_object_counts.get("Table", 0)
 st.subheader("使用されていないテーブル")
 st.markdown(f"**該当オブジェクト数: {unused_tables_count} 件**")
-st.dataframe(unused_tables_df)
+tables_page = paging.page_selector(unused_tables_count, key="unused_tables_page")
+st.dataframe(paging.fetch_unused_objects_page(session, unused_objects_query_id, "Table", days_option, tables_page))
 
 # 未使用ビュー
+unused_views_count = unused_object_counts.get("View", 0)
 st.subheader("使用されていないビュー")
 st.markdown(f"**該当オブジェクト数: {unused_views_count} 件**")
-st.dataframe(unused_views_df)
\ No newline at end of file
+views_page = paging.page_selector(unused_views_count, key="unused_views_page")
+st.dataframe(paging.fetch_unused_objects_page(
+    session, unused_objects_query_id, "View", days_option, views_page,
+    exclude=("OBJECT_DOMAIN", "TOTAL_STORAGE_TB", "ACTIVE_TB", "TIME_TRAVEL_TB", "FAILSAFE_TB", "RETAINED_FOR_CLONE_TB",
+             "RETENTION_TIME"),
+))
+
+# 未使用テーブルを削除、または保持日数を下げた場合の削減額の試算（スライダーを動かしてもクエリは再実行しない）
+st.subheader("未使用テーブルのストレージ削減額の試算")
+price_per_tb_month = st.slider("ストレージ単価（USD / TB / 月）", min_value=0.0, max_value=50.0,
+                               value=savings.DEFAULT_PRICE_PER_TB_MONTH, step=0.5)
+retention_days = st.slider("変更後の DATA_RETENTION_TIME_IN_DAYS", min_value=0, max_value=90, value=1)
+savings_df = savings.estimate_savings(
+    fetch_unused_table_storage(session, unused_objects_query_id, days_option), retention_days, price_per_tb_month
+)
+savings_total = savings.summarize_savings(savings_df)
+drop_column, retention_column = st.columns(2)
+drop_column.metric("削除した場合（USD / 月）", f"{savings_total['DROP_SAVINGS_USD_PER_MONTH']:,.0f}",
+                   f"{savings_total['DROP_SAVINGS_TB']:,.2f} TB")
+retention_column.metric(f"保持日数を{retention_days}日にした場合（USD / 月）",
+                        f"{savings_total['RETENTION_SAVINGS_USD_PER_MONTH']:,.0f}",
+                        f"{savings_total['RETENTION_SAVINGS_TB']:,.2f} TB")
+st.dataframe(savings_df.sort_values("DROP_SAVINGS_USD_PER_MONTH", ascending=False).head(paging.PAGE_SIZE))
+
+# 未使用ストレージの集計（データベース → スキーマ → オーナーロールの順にドリルダウン）
+st.subheader("未使用オブジェクトの多いデータベース・スキーマ")
+rollups_df = fetch_unused_object_rollups(session, unused_objects_query_id, days_option)
+rollup_columns = ["UNUSED_STORAGE_TB", "UNUSED_TABLES", "UNUSED_VIEWS"]
+database_rollups_df = rollups_df[rollups_df["ROLLUP_LEVEL"] == "database"].set_index("DATABASE_NAME")[rollup_columns]
+st.bar_chart(database_rollups_df["UNUSED_STORAGE_TB"].astype("float64").head(20))
+st.dataframe(database_rollups_df)
+
+if len(database_rollups_df) > 0:
+    selected_database = st.selectbox("スキーマごとに表示するデータベース", list(database_rollups_df.index))
+    schema_rollups_df = rollups_df[
+        (rollups_df["ROLLUP_LEVEL"] == "schema") & (rollups_df["DATABASE_NAME"] == selected_database)
+    ].set_index("SCHEMA_NAME")[rollup_columns]
+    st.dataframe(schema_rollups_df)
+
+    if len(schema_rollups_df) > 0:
+        selected_schema = st.selectbox("オーナーロールごとに表示するスキーマ", list(schema_rollups_df.index))
+        owner_rollups_df = rollups_df[
+            (rollups_df["ROLLUP_LEVEL"] == "owner_role")
+            & (rollups_df["DATABASE_NAME"] == selected_database)
+            & (rollups_df["SCHEMA_NAME"] == selected_schema)
+        ].set_index("OWNER_ROLE")[rollup_columns]
+        st.dataframe(owner_rollups_df)
+
+# 未使用カラム（テーブル → カラムの順にドリルダウン）
+st.subheader("使用されていないカラムが多いテーブル")
+column_usage_df = async_jobs.fetch_result(session, health_checks["column_usage_by_table"])
+unused_columns = column_usage_df[f"UNUSED_COLUMNS_{days_option}D"]
+column_usage_df = column_usage_df.assign(
+    UNUSED_COLUMNS=unused_columns,
+    UNUSED_COLUMN_RATIO=(unused_columns / column_usage_df["TOTAL_COLUMNS"]).round(3),
+)[["TABLE_ID", "FULLY_QUALIFIED_TABLE_NAME", "TOTAL_COLUMNS", "UNUSED_COLUMNS", "UNUSED_COLUMN_RATIO", "LAST_ACCESSED_AT"]]
+# テーブル自体が未使用のものは上の一覧に出ているため、読まれているテーブルだけを対象にする
+column_usage_df = column_usage_df[
+    column_usage_df["LAST_ACCESSED_AT"].notna() & (column_usage_df["UNUSED_COLUMNS"] > 0)
+].sort_values(["UNUSED_COLUMNS", "UNUSED_COLUMN_RATIO"], ascending=False)
+st.markdown(f"**該当テーブル数: {len(column_usage_df)} 件**")
+st.dataframe(column_usage_df)
+
+if len(column_usage_df) > 0:
+    table_names = dict(zip(column_usage_df["TABLE_ID"], column_usage_df["FULLY_QUALIFIED_TABLE_NAME"]))
+    selected_table_id = st.selectbox(
+        "カラムごとの利用状況を表示するテーブル",
+        list(table_names),
+        format_func=lambda table_id: table_names[table_id],
+    )
+    column_detail_df = fetch_column_usage_detail(int(selected_table_id))
+    column_detail_df = column_detail_df.assign(UNUSED=is_unused(column_detail_df, days_option))
+    st.dataframe(column_detail_df)
@@ -0,0 +1,73 @@
+import streamlit as st
+from snowflake_session import get_refresh_session, get_session
+from snowflake_utils import load_sql, run_sql_file
+
+session = get_session()
+
+# 集計期間の選択肢（日数）と、取得結果をキャッシュする秒数
+# 最長の期間を変えるときは、sql/refresh_query_hot_spots.sql の初回集計の日数も合わせる
+PERIOD_OPTIONS = [7, 30, 90]
+CACHE_TTL_SECONDS = 3600
+TOP_N = 50
+
+# ランキングの指標（表示名 → 列名）
+RANKING_METRICS = {
+    "実行時間（合計）": "TOTAL_ELAPSED_HOURS",
+    "スキャン量": "BYTES_SCANNED_TB",
+    "スピル量": "BYTES_SPILLED_GB",
+    "推定クレジット": "ESTIMATED_CREDITS",
+}
+
+# query_history・warehouse_metering_history の差分で query_hot_spots を更新する（トランザクションを使うため専用のセッションで実行する）
+def refresh_query_hot_spots():
+    run_sql_file(get_refresh_session(), "sql/refresh_query_hot_spots.sql")
+
+# 期間内のクエリの種類ごとのコスト
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner="クエリのコストを集計しています...")
+def fetch_query_hot_spots(days):
+    return session.sql(load_sql("sql/query_hot_spots.sql"), params=[days]).to_pandas()
+
+# 1種類のクエリが読み書きしたテーブル・ビュー
+@st.cache_data(ttl=CACHE_TTL_SECONDS, show_spinner="アクセスしたテーブルを取得しています...")
+def fetch_query_hot_spot_tables(query_parameterized_hash, days):
+    return session.sql(
+        load_sql("sql/query_hot_spot_tables.sql"), params=[query_parameterized_hash, days, days]
+    ).to_pandas()
+
+# 集計テーブルを用意し、空なら直近90日分（最長の集計期間）を初回集計する
+if "query_hot_spots_ready" not in st.session_state:
+    run_sql_file(session, "sql/query_hot_spots_setup.sql")
+    if session.sql("select count(*) from query_hot_spots").collect()[0][0] == 0:
+        with st.spinner("クエリのコストを初回集計しています..."):
+            refresh_query_hot_spots()
+    st.session_state.query_hot_spots_ready = True
+
+# Streamlit UI
+st.title("コストの大きいクエリの特定")
+
+with st.sidebar:
+    st.subheader("クエリコストの集計")
+    if st.button("最新の query_history で更新"):
+        with st.spinner("更新しています..."):
+            refresh_query_hot_spots()
+        fetch_query_hot_spots.clear()
+        fetch_query_hot_spot_tables.clear()
+    last_query_date = session.sql("select max(query_date) from query_hot_spots").collect()[0][0]
+    st.caption(f"集計済みの最終日: {last_query_date}")
+
+days = st.radio("集計期間（日数）を選択してください", PERIOD_OPTIONS, index=1, horizontal=True)
+metric_label = st.selectbox("ランキングの指標", list(RANKING_METRICS))
+metric = RANKING_METRICS[metric_label]
+
+hot_spots_df = fetch_query_hot_spots(days).sort_values(metric, ascending=False).head(TOP_N)
+
+st.subheader(f"{metric_label}の大きいクエリ（上位{TOP_N}件）")
+st.dataframe(hot_spots_df.drop(columns="SAMPLE_QUERY_TEXT"))
+
+# クエリの種類 → アクセスしたテーブルの順にドリルダウン
+if len(hot_spots_df) > 0:
+    selected_hash = st.selectbox("アクセスしたテーブルを表示するクエリ", hot_spots_df["QUERY_PARAMETERIZED_HASH"])
+    selected = hot_spots_df[hot_spots_df["QUERY_PARAMETERIZED_HASH"] == selected_hash].iloc[0]
+    st.code(selected["SAMPLE_QUERY_TEXT"], language="sql")
+    st.caption(f"実行時間が最も長かったクエリ: {selected['SAMPLE_QUERY_ID']}")
+    st.dataframe(fetch_query_hot_spot_tables(selected_hash, days))
@@ -0,0 +1,62 @@
+import re
+import pandas as pd
+import streamlit as st
+
+# 1ページに表示する行数
+PAGE_SIZE = 500
+
+_QUERY_ID = re.compile(r"^[0-9a-f-]+$")
+
+# 実行済みクエリの結果を RESULT_SCAN で読む FROM 句（結果は Snowflake 側に24時間保持される）
+def result_scan(query_id):
+    if not _QUERY_ID.match(query_id):
+        raise ValueError(f"不正なクエリID: {query_id}")
+    return f"table(result_scan('{query_id}'))"
+
+# 未使用期間の条件（最終アクセスから days 日より前、またはアクセス履歴なし）
+def unused_condition(days):
+    return f"(days_since_last_access is null or days_since_last_access > {int(days)})"
+
+# クエリを実行し、結果を Arrow のまま受け取って Arrow 型の列を持つ DataFrame にする
+def fetch_arrow_dataframe(session, sql):
+    cursor = session.connection.cursor()
+    try:
+        cursor.execute(sql)
+        table = cursor.fetch_arrow_all()
+        if table is None:
+            return pd.DataFrame(columns=[column[0] for column in cursor.description])
+        return table.to_pandas(types_mapper=pd.ArrowDtype)
+    finally:
+        cursor.close()
+
+# 未使用オブジェクトの種別ごとの件数（COUNT(*) を Snowflake 側で行う）
+@st.cache_data(max_entries=64, show_spinner=False)
+def count_unused_objects(_session, query_id, days):
+    counts = fetch_arrow_dataframe(
+        _session,
+        f"select object_domain, count(*) as object_count from {result_scan(query_id)} "
+        f"where {unused_condition(days)} group by 1",
+    )
+    return dict(zip(counts["OBJECT_DOMAIN"], counts["OBJECT_COUNT"].astype("int64")))
+
+# 未使用オブジェクトの1ページ分（total_storage_tb の大きい順）
+@st.cache_data(max_entries=256, show_spinner=False)
+def fetch_unused_objects_page(_session, query_id, object_domain, days, page, exclude=("OBJECT_DOMAIN",)):
+    if object_domain not in ("Table", "View"):
+        raise ValueError(f"不正なオブジェクト種別: {object_domain}")
+    return fetch_arrow_dataframe(
+        _session,
+        f"select * exclude ({', '.join(exclude)}) from {result_scan(query_id)} "
+        f"where object_domain = '{object_domain}' and {unused_condition(days)} "
+        f"order by total_storage_tb desc, fully_qualified_table_name "
+        f"limit {PAGE_SIZE} offset {int(page) * PAGE_SIZE}",
+    )
+
+# 件数からページ数を求めてページ番号の入力欄を表示し、選択されたページ番号（0始まり）を返す
+def page_selector(total, key):
+    page_count = max(1, -(-total // PAGE_SIZE))
+    if page_count == 1:
+        return 0
+    page = st.number_input(f"ページ（全 {page_count} ページ、{PAGE_SIZE} 件ずつ）", min_value=1,
+                           max_value=page_count, value=1, step=1, key=key)
+    return page - 1
@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+# ストレージ単価の既定値（USD / TB / 月、オンデマンドの米国リージョン相当）
+DEFAULT_PRICE_PER_TB_MONTH = 23.0
+
+# テーブルを削除した場合に解放される量（TB）
+# 削除したテーブルの領域はタイムトラベル・フェイルセーフ期間を過ぎると解放される。クローン元として保持されている領域はクローンが残る限り解放されない
+def drop_savings_tb(storage_df):
+    return (
+        storage_df["ACTIVE_TB"].to_numpy(dtype="float64")
+        + storage_df["TIME_TRAVEL_TB"].to_numpy(dtype="float64")
+        + storage_df["FAILSAFE_TB"].to_numpy(dtype="float64")
+    )
+
+# DATA_RETENTION_TIME_IN_DAYS を retention_days に下げた場合に解放される量（TB）
+# タイムトラベルの量は保持日数に比例するとみなす。現在の保持日数以上に上げる場合や保持日数が0のテーブルは0
+def retention_savings_tb(storage_df, retention_days):
+    time_travel_tb = storage_df["TIME_TRAVEL_TB"].to_numpy(dtype="float64")
+    current_days = storage_df["RETENTION_TIME"].to_numpy(dtype="float64", na_value=0.0)
+    kept_ratio = np.divide(
+        np.minimum(retention_days, current_days), current_days,
+        out=np.ones_like(current_days), where=current_days > 0,
+    )
+    return time_travel_tb * (1.0 - kept_ratio)
+
+# テーブルごとの削除・保持日数変更による解放量と月額の削減額を計算する
+def estimate_savings(storage_df, retention_days, price_per_tb_month=DEFAULT_PRICE_PER_TB_MONTH):
+    drop_tb = drop_savings_tb(storage_df)
+    retention_tb = retention_savings_tb(storage_df, retention_days)
+    return storage_df.assign(
+        DROP_SAVINGS_TB=drop_tb,
+        DROP_SAVINGS_USD_PER_MONTH=drop_tb * price_per_tb_month,
+        RETENTION_SAVINGS_TB=retention_tb,
+        RETENTION_SAVINGS_USD_PER_MONTH=retention_tb * price_per_tb_month,
+    )
+
+# 削除・保持日数変更それぞれの合計（TB と USD / 月）
+def summarize_savings(savings_df):
+    return pd.Series({
+        "DROP_SAVINGS_TB": savings_df["DROP_SAVINGS_TB"].sum(),
+        "DROP_SAVINGS_USD_PER_MONTH": savings_df["DROP_SAVINGS_USD_PER_MONTH"].sum(),
+        "RETENTION_SAVINGS_TB": savings_df["RETENTION_SAVINGS_TB"].sum(),
+        "RETENTION_SAVINGS_USD_PER_MONTH": savings_df["RETENTION_SAVINGS_USD_PER_MONTH"].sum(),
+    })
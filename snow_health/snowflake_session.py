@@ -0,0 +1,13 @@
+import streamlit as st
+from snowflake_utils import create_session
+
+# Snowflakeに接続（セッションはアプリ全体・全ページで共有する）
+@st.cache_resource
+def get_session():
+    return create_session()
+
+# BEGIN〜COMMIT を含む差分更新（sql/refresh_*.sql）専用のセッション
+# 共有セッションで開いたトランザクションに他のページのクエリが入り込み、失敗時のロールバックで一緒に取り消されないよう分ける
+@st.cache_resource
+def get_refresh_session():
+    return create_session()
@@ -0,0 +1,42 @@
+import json
+import threading
+from snowflake.snowpark.session import Session
+from cryptography.hazmat.primitives import serialization
+
+# connection.json の接続情報で Snowpark セッションを作成する
+def create_session(connection_file="./connection.json"):
+    # JSONファイルを読み込む
+    with open(connection_file) as f:
+        snowflake_connection_cfg = json.load(f)
+
+    # 秘密鍵ファイルの読み込みとデコード
+    private_key_path = snowflake_connection_cfg["private_key"]
+    with open(private_key_path, "rb") as key_file:
+        private_key = serialization.load_pem_private_key(
+            key_file.read(),
+            password=None
+        )
+
+    snowflake_connection_cfg["private_key"] = private_key
+    return Session.builder.configs(snowflake_connection_cfg).create()
+
+# SQLファイルを読み込む関数
+def load_sql(file_path):
+    with open(file_path, "r") as file:
+        return file.read()
+
+# セッションは全ユーザーで共有するため、SQLファイルは同時に1つだけ実行する
+# トランザクションを含むファイルは、ほかのクエリが入り込まないよう専用のセッション（snowflake_session.get_refresh_session）で実行する
+_run_sql_file_lock = threading.Lock()
+
+# SQLファイル内の文を順に実行する関数（文の区切りは「;」）
+# 途中で失敗した場合は、ファイル内で開始したトランザクションを残さないようにロールバックする
+def run_sql_file(session, file_path):
+    with _run_sql_file_lock:
+        try:
+            for statement in load_sql(file_path).split(";"):
+                if statement.strip():
+                    session.sql(statement).collect()
+        except Exception:
+            session.sql("rollback").collect()
+            raise
@@ -0,0 +1,23 @@
+-- テーブルごとのカラム数と、期間ごとの未使用カラム数（column_usage に記録がない、または最終アクセスが期間より前）
+with columns as (
+    select
+        table_id,
+        column_id,
+        table_catalog || '.' || table_schema || '.' || table_name as fully_qualified_table_name
+    from snowflake.account_usage.columns
+    where deleted is null
+)
+select
+    columns.table_id,
+    columns.fully_qualified_table_name,
+    count(*) as total_columns,
+    count_if(coalesce(column_usage.last_accessed_at, date'1900-01-01') < (current_date - 30)) as unused_columns_30d,
+    count_if(coalesce(column_usage.last_accessed_at, date'1900-01-01') < (current_date - 90)) as unused_columns_90d,
+    count_if(coalesce(column_usage.last_accessed_at, date'1900-01-01') < (current_date - 180)) as unused_columns_180d,
+    count_if(coalesce(column_usage.last_accessed_at, date'1900-01-01') < (current_date - 360)) as unused_columns_360d,
+    max(column_usage.last_accessed_at) as last_accessed_at
+from columns
+left join column_usage
+    on columns.table_id = column_usage.table_id
+    and columns.column_id = column_usage.column_id
+group by 1, 2
@@ -0,0 +1,14 @@
+-- 1テーブル分のカラムごとの最終アクセスとクエリ数（テーブルIDはバインド変数で渡す）
+select
+    columns.column_name,
+    columns.data_type,
+    column_usage.last_accessed_at,
+    datediff('day', column_usage.last_accessed_at, current_date) as days_since_last_access,
+    coalesce(column_usage.query_count, 0) as query_count
+from snowflake.account_usage.columns
+left join column_usage
+    on columns.table_id = column_usage.table_id
+    and columns.column_id = column_usage.column_id
+where columns.table_id = ?
+    and columns.deleted is null
+order by columns.ordinal_position
@@ -0,0 +1,13 @@
+-- カラムごとの最終アクセスとクエリ数を保持するサマリーテーブル（接続先のデータベース・スキーマに作成）
+create table if not exists column_usage (
+    table_id integer not null,
+    column_id integer not null,
+    column_name text,
+    last_accessed_at timestamp_ltz,
+    query_count integer not null
+);
+
+-- column_usage に集計済みの access_history の範囲（query_start_time の上限）
+create table if not exists column_usage_watermark (
+    processed_until timestamp_ltz not null
+);
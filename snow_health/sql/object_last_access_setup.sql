@@ -0,0 +1,9 @@
+-- オブジェクトごとの最終アクセスを保持するサマリーテーブル（接続先のデータベース・スキーマに作成）
+create table if not exists object_last_access (
+    object_id integer not null,
+    object_domain text not null,
+    object_name text,
+    last_accessed_at timestamp_ltz,
+    last_accessed_by text,
+    last_query_id text
+);
@@ -0,0 +1,24 @@
+-- 1種類のクエリ（query_parameterized_hash）が直近の期間に読み書きしたテーブル・ビュー（ハッシュ・日数・日数の順にバインド変数で渡す）
+with fingerprint_queries as (
+    select query_id
+    from snowflake.account_usage.query_history
+    where query_parameterized_hash = ?
+        and start_time >= current_date - ?
+)
+, access_history_flattened as (
+    select
+        access_history.query_id,
+        objects_accessed.value:objectid::integer as object_id,
+        objects_accessed.value:objectname::text as object_name,
+        objects_accessed.value:objectdomain::text as object_domain
+    from snowflake.account_usage.access_history, lateral flatten(access_history.base_objects_accessed) as objects_accessed
+    where access_history.query_start_time >= current_date - ?
+        and access_history.query_id in (select query_id from fingerprint_queries)
+)
+select
+    object_name,
+    object_domain,
+    count(distinct query_id) as query_count
+from access_history_flattened
+group by 1, 2
+order by query_count desc
@@ -0,0 +1,14 @@
+-- 直近の期間（日数）のクエリの種類ごとのコスト（日数はバインド変数で渡す）
+select
+    query_parameterized_hash,
+    sum(query_count) as query_count,
+    sum(total_elapsed_ms) / 1000 / 3600 as total_elapsed_hours,
+    sum(bytes_scanned) / power(1024, 4) as bytes_scanned_tb,
+    sum(bytes_spilled) / power(1024, 3) as bytes_spilled_gb,
+    sum(estimated_credits) as estimated_credits,
+    array_to_string(array_unique_agg(warehouse_name), ', ') as warehouse_names,
+    max_by(sample_query_id, total_elapsed_ms) as sample_query_id,
+    max_by(sample_query_text, total_elapsed_ms) as sample_query_text
+from query_hot_spots
+where query_date >= current_date - ?
+group by 1
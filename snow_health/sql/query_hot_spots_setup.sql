@@ -0,0 +1,13 @@
+-- クエリの種類（query_parameterized_hash）・ウェアハウス・日付ごとのコスト集計（接続先のデータベース・スキーマに作成）
+create table if not exists query_hot_spots (
+    query_date date not null,
+    warehouse_name text,
+    query_parameterized_hash text not null,
+    query_count integer not null,
+    total_elapsed_ms integer not null,
+    bytes_scanned integer not null,
+    bytes_spilled integer not null,
+    estimated_credits float not null,
+    sample_query_id text,
+    sample_query_text text
+);
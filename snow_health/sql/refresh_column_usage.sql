@@ -0,0 +1,50 @@
+-- column_usage を前回集計した範囲より後の access_history だけで更新する
+-- クエリ数を加算するため同じ行を二度読まないよう、access_history の反映遅れ（最大3時間）より前の範囲までを集計し、その上限を記録する
+-- 集計と上限の記録は1つのトランザクションで行う。最初に上限のテーブルを更新してロックを取り、同時に実行された更新は前の更新の完了を待ってから読む
+begin;
+
+update column_usage_watermark set processed_until = processed_until;
+
+set column_usage_until = dateadd(hour, -3, current_timestamp());
+
+merge into column_usage as target
+using (
+    with high_water_mark as (
+        select coalesce(max(processed_until), '1970-01-01'::timestamp_ltz) as since
+        from column_usage_watermark
+    )
+    , access_history_flattened as (
+        select
+            access_history.query_id,
+            access_history.query_start_time,
+            objects_accessed.value:objectid::integer as table_id,
+            objects_accessed.value:columns as columns_array
+        from snowflake.account_usage.access_history, lateral flatten(access_history.base_objects_accessed) as objects_accessed
+        where access_history.query_start_time > (select since from high_water_mark)
+            and access_history.query_start_time <= $column_usage_until
+            and objects_accessed.value:objectdomain::text = 'Table'
+    )
+    select
+        table_id,
+        columns_accessed.value:columnId::integer as column_id,
+        max_by(columns_accessed.value:columnName::text, query_start_time) as column_name,
+        max(query_start_time) as last_accessed_at,
+        count(distinct query_id) as query_count
+    from access_history_flattened, lateral flatten(columns_array) as columns_accessed
+    group by 1, 2
+) as source
+    on target.table_id = source.table_id
+    and target.column_id = source.column_id
+when matched then update set
+    column_name = source.column_name,
+    last_accessed_at = greatest(target.last_accessed_at, source.last_accessed_at),
+    query_count = target.query_count + source.query_count
+when not matched then insert
+    (table_id, column_id, column_name, last_accessed_at, query_count)
+    values (source.table_id, source.column_id, source.column_name, source.last_accessed_at, source.query_count);
+
+delete from column_usage_watermark;
+
+insert into column_usage_watermark (processed_until) select $column_usage_until;
+
+commit;
@@ -0,0 +1,61 @@
+-- object_last_access を前回の最終アクセス日時（ハイウォーターマーク）以降の access_history だけで更新する
+-- access_history は最大数時間遅れて反映されるため、ハイウォーターマークの1日前から読み直す（MERGE なので重複しても結果は同じ）
+-- テーブルは base_objects_accessed（ビュー経由の参照も元テーブルとして記録される）、ビューは direct_objects_accessed から読む
+-- ハイウォーターマークは種別ごとに持つ（ビューの行がまだなければ、ビューだけ access_history の最初から読む）
+merge into object_last_access as target
+using (
+    with high_water_mark as (
+        select
+            coalesce(max(iff(object_domain = 'Table', last_accessed_at, null)), '1970-01-01'::timestamp_ltz) - interval '1 day' as table_since,
+            coalesce(max(iff(object_domain = 'View', last_accessed_at, null)), '1970-01-01'::timestamp_ltz) - interval '1 day' as view_since
+        from object_last_access
+    )
+    , access_history_since as (
+        select *
+        from snowflake.account_usage.access_history
+        where query_start_time > (select least(table_since, view_since) from high_water_mark)
+    )
+    , access_history_flattened as (
+        select
+            access_history.query_id,
+            access_history.query_start_time,
+            access_history.user_name,
+            objects_accessed.value:objectid::integer as object_id,
+            objects_accessed.value:objectname::text as object_name,
+            objects_accessed.value:objectdomain::text as object_domain
+        from access_history_since as access_history, lateral flatten(access_history.base_objects_accessed) as objects_accessed
+        where objects_accessed.value:objectdomain::text = 'Table'
+            and access_history.query_start_time > (select table_since from high_water_mark)
+        union all
+        select
+            access_history.query_id,
+            access_history.query_start_time,
+            access_history.user_name,
+            objects_accessed.value:objectid::integer as object_id,
+            objects_accessed.value:objectname::text as object_name,
+            objects_accessed.value:objectdomain::text as object_domain
+        from access_history_since as access_history, lateral flatten(access_history.direct_objects_accessed) as objects_accessed
+        where objects_accessed.value:objectdomain::text = 'View'
+            and access_history.query_start_time > (select view_since from high_water_mark)
+    )
+    select
+        object_id,
+        object_domain,
+        max_by(object_name, query_start_time) as object_name,
+        max(query_start_time) as last_accessed_at,
+        max_by(user_name, query_start_time) as last_accessed_by,
+        max_by(query_id, query_start_time) as last_query_id
+    from access_history_flattened
+    group by 1, 2
+) as source
+    on target.object_id = source.object_id
+    and target.object_domain = source.object_domain
+when matched and source.last_accessed_at > target.last_accessed_at then update set
+    object_name = source.object_name,
+    last_accessed_at = source.last_accessed_at,
+    last_accessed_by = source.last_accessed_by,
+    last_query_id = source.last_query_id
+when not matched then insert
+    (object_id, object_domain, object_name, last_accessed_at, last_accessed_by, last_query_id)
+    values (source.object_id, source.object_domain, source.object_name, source.last_accessed_at,
+            source.last_accessed_by, source.last_query_id);
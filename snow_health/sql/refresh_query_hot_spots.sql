@@ -0,0 +1,67 @@
+-- query_hot_spots を集計済みの最終日の前日以降だけ集計し直す
+-- query_history・warehouse_metering_history は数時間遅れて反映されるため、直近の日付は毎回削除してから集計し直す
+-- 削除と再集計は1つのトランザクションで行う（失敗しても日付が欠けず、同時に実行されても後の更新が同じ範囲を削除してから入れ直すため重複しない）
+-- 初回は pages/1_query_hot_spots.py の集計期間の最長（PERIOD_OPTIONS の 90日）分を集計する
+begin;
+
+set query_hot_spots_since = (
+    select coalesce(max(query_date) - 1, current_date - 90)
+    from query_hot_spots
+);
+
+delete from query_hot_spots where query_date >= $query_hot_spots_since;
+
+insert into query_hot_spots
+with queries as (
+    select
+        query_id,
+        query_parameterized_hash,
+        query_text,
+        warehouse_name,
+        start_time,
+        date_trunc('hour', start_time) as start_hour,
+        total_elapsed_time,
+        execution_time,
+        bytes_scanned,
+        bytes_spilled_to_local_storage + bytes_spilled_to_remote_storage as bytes_spilled
+    from snowflake.account_usage.query_history
+    where start_time >= $query_hot_spots_since
+        and query_parameterized_hash is not null
+)
+-- ウェアハウスの1時間あたりのクレジットを、その時間に実行したクエリの実行時間で按分する
+, warehouse_hours as (
+    select
+        warehouse_name,
+        start_time as start_hour,
+        credits_used_compute
+    from snowflake.account_usage.warehouse_metering_history
+    where start_time >= $query_hot_spots_since
+)
+, queries_with_credits as (
+    select
+        queries.*,
+        coalesce(
+            warehouse_hours.credits_used_compute * queries.execution_time
+                / nullif(sum(queries.execution_time) over (partition by queries.warehouse_name, queries.start_hour), 0),
+            0
+        ) as estimated_credits
+    from queries
+    left join warehouse_hours
+        on queries.warehouse_name = warehouse_hours.warehouse_name
+        and queries.start_hour = warehouse_hours.start_hour
+)
+select
+    start_time::date as query_date,
+    warehouse_name,
+    query_parameterized_hash,
+    count(*) as query_count,
+    sum(total_elapsed_time) as total_elapsed_ms,
+    sum(bytes_scanned) as bytes_scanned,
+    sum(bytes_spilled) as bytes_spilled,
+    sum(estimated_credits) as estimated_credits,
+    max_by(query_id, total_elapsed_time) as sample_query_id,
+    left(max_by(query_text, total_elapsed_time), 2000) as sample_query_text
+from queries_with_credits
+group by 1, 2, 3;
+
+commit;
@@ -0,0 +1,22 @@
+-- 未使用オブジェクトの件数・ストレージ量をデータベース → スキーマ → オーナーロールの階層で1回のクエリで集計する
+-- {result_scan} は未使用オブジェクトのクエリ結果、{unused_condition} は期間の条件に置き換える
+select
+    database_name,
+    schema_name,
+    owner_role,
+    case grouping_id(database_name, schema_name, owner_role)
+        when 3 then 'database'
+        when 1 then 'schema'
+        else 'owner_role'
+    end as rollup_level,
+    count_if(object_domain = 'Table') as unused_tables,
+    count_if(object_domain = 'View') as unused_views,
+    sum(total_storage_tb) as unused_storage_tb
+from {result_scan}
+where {unused_condition}
+group by grouping sets (
+    (database_name),
+    (database_name, schema_name),
+    (database_name, schema_name, owner_role)
+)
+order by unused_storage_tb desc
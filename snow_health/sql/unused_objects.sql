@@ -0,0 +1,61 @@
+-- 最終アクセスは object_last_access（refresh_object_last_access.sql で差分更新）から読む
+with object_access_summary as (
+    select
+        object_id as table_id,
+        object_domain,
+        last_accessed_at,
+        last_accessed_by,
+        last_query_id
+    from object_last_access
+)
+, table_storage_metrics as (
+    select
+        table_storage_metrics.id as table_id,
+        table_storage_metrics.table_catalog || '.' || table_storage_metrics.table_schema || '.' || table_storage_metrics.table_name as fully_qualified_table_name,
+        table_storage_metrics.table_catalog as database_name,
+        table_storage_metrics.table_schema as schema_name,
+        tables.table_owner as owner_role,
+        (active_bytes + time_travel_bytes + failsafe_bytes + retained_for_clone_bytes)/power(1024,4) as total_storage_tb,
+        active_bytes/power(1024,4) as active_tb,
+        time_travel_bytes/power(1024,4) as time_travel_tb,
+        failsafe_bytes/power(1024,4) as failsafe_tb,
+        retained_for_clone_bytes/power(1024,4) as retained_for_clone_tb,
+        tables.retention_time
+    from snowflake.account_usage.table_storage_metrics
+    left join snowflake.account_usage.tables
+        on table_storage_metrics.id = tables.table_id
+        and tables.deleted is null
+    where not table_storage_metrics.deleted
+)
+, objects as (
+    select
+        'Table' as object_domain,
+        table_storage_metrics.*
+    from table_storage_metrics
+    union all
+    select
+        'View' as object_domain,
+        table_id,
+        table_catalog || '.' || table_schema || '.' || table_name as fully_qualified_table_name,
+        table_catalog as database_name,
+        table_schema as schema_name,
+        table_owner as owner_role,
+        0 as total_storage_tb,
+        0 as active_tb,
+        0 as time_travel_tb,
+        0 as failsafe_tb,
+        0 as retained_for_clone_tb,
+        null as retention_time
+    from snowflake.account_usage.views
+    where deleted is null
+)
+select
+    objects.*,
+    object_access_summary.* exclude (table_id, object_domain),
+    datediff('day', last_accessed_at, current_date) as days_since_last_access
+from objects
+left join object_access_summary
+    on objects.table_id = object_access_summary.table_id
+    and objects.object_domain = object_access_summary.object_domain
+where coalesce(last_accessed_at, date'1900-01-01') < (current_date - 30)
+order by objects.total_storage_tb desc;
@@ -1,12 +1,38 @@
 import os
 import re
+import sys
 import json
+import fnmatch
+import hashlib
+import argparse
+import functools
+import threading
 import yaml
 import pandas as pd
-import snowflake.connector
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from openpyxl import Workbook, load_workbook
 from cryptography.hazmat.primitives import serialization
 
-def get_snowflake_connection():
+sys.path.append(str(Path(__file__).resolve().parents[1] / "common"))
+import connection_pool
+import sampling
+
+MAX_CONNECTIONS = 16  # 接続プールの上限（並列度の上限）
+
+DEFAULT_DATABASE = "D_HARATO_DB"
+DEFAULT_SCHEMA = "NOTION"
+OUTPUT_EXCEL_FILE = "merged_view_definition.xlsx"
+STATE_FILE = ".definition_state.json"  # 差分出力用のマニフェスト（ビューごとのフィンガープリント）
+
+DESIRED_COLUMNS = [
+    "materialized", "grade", "status", "target_user",
+    "データベース名", "スキーマ名", "カラム名", "データ型", "項目桁", "description",
+    "サンプル値", "SPUっチェック", "仮名加工", "仮名加工処理"
+]
+
+@functools.lru_cache(maxsize=None)
+def get_connection_pool():
 
     with open("connection.json") as f:
         config = json.load(f)
@@ -19,7 +45,8 @@ def get_snowflake_connection():
         format=serialization.PrivateFormat.PKCS8,
         encryption_algorithm=serialization.NoEncryption()
     )
-    conn = snowflake.connector.connect(
+    return connection_pool.get_pool(
+        max_size=MAX_CONNECTIONS,
         account=config["account"],
         user=config["user"],
         private_key=private_key_bytes,
@@ -28,103 +55,321 @@ def get_snowflake_connection():
         schema=config["schema"],
         role=config["role"]
     )
-    return conn
 
-def fetch_view_definition():
+def load_models(yaml_dir, yaml_glob, patterns, database=DEFAULT_DATABASE, schema=DEFAULT_SCHEMA):
+    """YAML ファイル群から、名前が patterns（glob 可）のいずれかに一致する dbt モデルを読み込む"""
 
-    conn = get_snowflake_connection()
-    try:
-        cs = conn.cursor()
-        cs.execute("DESC VIEW D_HARATO_DB.NOTION.NOTION_MART;")
-        rows = cs.fetchall()
-        data = []
-        for row in rows:
-            col_name = row[0]
-            full_type = row[1]
-            match = re.match(r"^([^(]+)(?:\(([^)]+)\))?", full_type)
-            if match:
-                base_type = match.group(1).strip()
-                length = match.group(2).strip() if match.group(2) else ""
-            else:
-                base_type = full_type
-                length = ""
-            data.append({
-                "カラム名": col_name,
-                "データ型": base_type,
-                "項目桁": length
-            })
-        df = pd.DataFrame(data)
-        return df
-    finally:
-        cs.close()
-        conn.close()
+    models = {}
+    for yaml_path in sorted(Path(yaml_dir).glob(yaml_glob)):
+        with open(yaml_path, "r", encoding="utf-8") as f:
+            model_yaml = yaml.safe_load(f) or {}
+        for model in model_yaml.get("models", []) or []:
+            name = model.get("name", "")
+            if not name or not any(fnmatch.fnmatch(name.lower(), pattern.lower()) for pattern in patterns):
+                continue
+            config = model.get("config", {}) or {}
+            meta = model.get("meta", {}) or config.get("meta", {}) or {}
+            models[name.lower()] = {
+                "name": name.upper(),
+                "yaml_path": str(yaml_path),
+                "database": (config.get("database") or database).upper(),
+                "schema": (config.get("schema") or schema).upper(),
+                "materialized": model.get("materialized", "") or config.get("materialized", ""),
+                "grade": meta.get("grade", ""),
+                "status": meta.get("status", ""),
+                "target_user": meta.get("target_user", ""),
+                "descriptions": {
+                    col["name"].upper(): col.get("description", "") for col in model.get("columns", []) or []
+                },
+            }
+    return list(models.values())
 
-def merge_with_yaml(df):
+def qualified_name(model):
+    return f'{model["database"]}.{model["schema"]}.{model["name"]}'
 
-    yaml_file = "notion_mart.yml"
-    output_excel_file = "merged_view_definition.xlsx"
+def format_data_type(data_type, char_length, numeric_precision, numeric_scale, datetime_precision):
+    """INFORMATION_SCHEMA.COLUMNS の型情報を DESC VIEW と同じ「データ型」「項目桁」に変換する"""
 
-    database_name = "D_HARATO_DB"
-    schema_name = "NOTION"
+    if data_type == "TEXT":
+        return "VARCHAR", str(char_length) if char_length is not None else ""
+    if data_type == "BINARY":
+        return "BINARY", str(char_length) if char_length is not None else ""
+    if data_type == "NUMBER":
+        return "NUMBER", f"{numeric_precision},{numeric_scale}" if numeric_precision is not None else ""
+    if data_type.startswith("TIMESTAMP") or data_type == "TIME":
+        return data_type, str(datetime_precision) if datetime_precision is not None else ""
+    return data_type, ""
 
-    with open(yaml_file, "r", encoding="utf-8") as f:
-        model_yaml = yaml.safe_load(f)
+def fetch_columns(models):
+    """
+    対象モデルのカラム定義を INFORMATION_SCHEMA.COLUMNS から取得する（データベースごとに1クエリ）。
+    戻り値は {"DB.SCHEMA.NAME": [{"カラム名", "データ型", "項目桁"}, ...]}
+    """
 
-    yaml_descriptions = {}
-    meta_info = {"grade": "", "status": "", "target_user": "", "materialized": ""}
-    for model in model_yaml.get("models", []):
-        if model.get("name", "").lower() == "notion_mart":
-            meta_info["materialized"] = model.get("materialized", "")
-            meta = model.get("meta", {})
-            meta_info["grade"] = meta.get("grade", "")
-            meta_info["status"] = meta.get("status", "")
-            meta_info["target_user"] = meta.get("target_user", "")
-            for col in model.get("columns", []):
-                yaml_descriptions[col["name"]] = col.get("description", "")
+    by_database = {}
+    for model in models:
+        by_database.setdefault(model["database"], []).append(model)
 
-    df["description"] = df["カラム名"].map(yaml_descriptions).fillna("")
-    df["カラム名"] = df["カラム名"].astype(str)
-    df["データベース名"] = database_name
-    df["スキーマ名"] = schema_name
-    df["grade"] = meta_info["grade"]
-    df["status"] = meta_info["status"]
-    df["target_user"] = meta_info["target_user"]
-    df["materialized"] = meta_info["materialized"]
-
-    conn = get_snowflake_connection()
-    sample_values = {}
-    try:
-        for col in df["カラム名"]:
+    columns = {}
+    if not by_database:
+        return columns
+    with get_connection_pool().connection() as conn:
+        for database, db_models in by_database.items():
+            targets = [f'{model["schema"]}.{model["name"]}' for model in db_models]
             cs = conn.cursor()
             try:
-                query = f"SELECT CAST({col} AS VARCHAR) FROM D_HARATO_DB.NOTION.NOTION_MART WHERE {col} IS NOT NULL LIMIT 1"
-                cs.execute(query)
-                result = cs.fetchone()
-                sample_values[col] = result[0] if result is not None else ""
-            except Exception as e:
-                sample_values[col] = ""
+                cs.execute(
+                    f"""
+                    SELECT table_schema, table_name, column_name, data_type, character_maximum_length,
+                           numeric_precision, numeric_scale, datetime_precision
+                    FROM {database}.INFORMATION_SCHEMA.COLUMNS
+                    WHERE table_schema || '.' || table_name IN ({", ".join(["%s"] * len(targets))})
+                    ORDER BY table_schema, table_name, ordinal_position
+                    """,
+                    targets
+                )
+                for schema_name, table_name, col_name, *type_info in cs.fetchall():
+                    base_type, length = format_data_type(*type_info)
+                    columns.setdefault(f"{database}.{schema_name}.{table_name}", []).append({
+                        "カラム名": col_name,
+                        "データ型": base_type,
+                        "項目桁": length
+                    })
             finally:
                 cs.close()
-    finally:
-        conn.close()
-    df["サンプル値"] = df["カラム名"].map(sample_values)
+    return columns
+
+def fetch_last_altered(models):
+    """対象モデルの LAST_ALTERED を INFORMATION_SCHEMA.TABLES から取得する（データベースごとに1クエリ）"""
+
+    by_database = {}
+    for model in models:
+        by_database.setdefault(model["database"], []).append(model)
+
+    last_altered = {}
+    if not by_database:
+        return last_altered
+    with get_connection_pool().connection() as conn:
+        for database, db_models in by_database.items():
+            targets = [f'{model["schema"]}.{model["name"]}' for model in db_models]
+            cs = conn.cursor()
+            try:
+                cs.execute(
+                    f"""
+                    SELECT table_schema, table_name, last_altered::VARCHAR
+                    FROM {database}.INFORMATION_SCHEMA.TABLES
+                    WHERE table_schema || '.' || table_name IN ({", ".join(["%s"] * len(targets))})
+                    """,
+                    targets
+                )
+                for schema_name, table_name, altered in cs.fetchall():
+                    last_altered[f"{database}.{schema_name}.{table_name}"] = altered
+            finally:
+                cs.close()
+    return last_altered
+
+def fingerprint(model, columns, last_altered):
+    """カラム構成・型・YAML の説明/メタ情報・LAST_ALTERED から、ビューのフィンガープリントを作る"""
+
+    document = json.dumps({
+        "model": {key: value for key, value in model.items() if key != "yaml_path"},
+        "columns": columns,
+        "last_altered": last_altered,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(document.encode("utf-8")).hexdigest()
+
+def load_state(state_file):
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file, "r", encoding="utf-8") as f:
+        return json.load(f)
 
+def save_state(state_file, state):
+    with open(state_file + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(state_file + ".tmp", state_file)
+
+def build_definition(model, columns, sample_values):
+    """1モデル分の定義書（DESIRED_COLUMNS の DataFrame）を作る"""
+
+    df = pd.DataFrame(columns, columns=["カラム名", "データ型", "項目桁"])
+    df["カラム名"] = df["カラム名"].astype(str)
+    df["description"] = df["カラム名"].str.upper().map(model["descriptions"]).fillna("")
+    df["データベース名"] = model["database"]
+    df["スキーマ名"] = model["schema"]
+    df["grade"] = model["grade"]
+    df["status"] = model["status"]
+    df["target_user"] = model["target_user"]
+    df["materialized"] = model["materialized"]
+    df["サンプル値"] = df["カラム名"].map(sample_values).fillna("")
     df["SPUっチェック"] = ""
     df["仮名加工"] = ""
     df["仮名加工処理"] = ""
+    return df[DESIRED_COLUMNS]
+
+def sample_models(models, columns, sampling_mode=sampling.BATCH, parallelism=sampling.DEFAULT_PARALLELISM,
+                  batch_size=sampling.DEFAULT_BATCH_SIZE, sample_rows=sampling.DEFAULT_SAMPLE_ROWS, timings=None):
+    """
+    モデルごとのサンプル値を並列に取得し、(model, 定義書 DataFrame) をモデル順に返すジェネレータ。
+    並列度はモデル間と、1モデル内のクエリ（バッチ/カラム）とで分け合う。
+    timings を渡すと、サンプリングの段階ごとの処理時間を全モデル分合計して加算する。
+    """
+
+    pool = get_connection_pool()
+    inner_parallelism = max(1, parallelism // max(1, len(models)))
+    timings_lock = threading.Lock()
 
-    desired_columns = [
-        "materialized", "grade", "status", "target_user",
-        "データベース名", "スキーマ名", "カラム名", "データ型", "項目桁", "description",
-        "サンプル値", "SPUっチェック", "仮名加工", "仮名加工処理"
-    ]
-    df = df[desired_columns]
+    def process(model):
+        model_columns = columns[qualified_name(model)]
+        model_timings = {}
+        sample_values = sampling.sample_column_values(
+            pool, qualified_name(model), [col["カラム名"] for col in model_columns],
+            mode=sampling_mode, parallelism=inner_parallelism, batch_size=batch_size, sample_rows=sample_rows,
+            timings=model_timings
+        )
+        if timings is not None:
+            with timings_lock:
+                for phase, seconds in model_timings.items():
+                    timings[phase] = timings.get(phase, 0.0) + seconds
+        return model, build_definition(model, model_columns, sample_values)
 
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+        yield from executor.map(process, models)
+
+def sheet_title(name, used):
+    """Excel のシート名（31文字以内・禁止文字なし・重複なし）を作る"""
+
+    title = re.sub(r"[\\/*?:\[\]]", "_", name)[:31]
+    candidate, suffix = title, 1
+    while candidate.lower() in used:
+        suffix += 1
+        candidate = f"{title[:31 - len(str(suffix)) - 1]}~{suffix}"
+    used.add(candidate.lower())
+    return candidate
+
+def write_workbook(output_excel_file, definitions):
+    """
+    (model, DataFrame) を1モデル1シートとして write-only ワークブックに順次書き出す。
+    戻り値は {"DB.SCHEMA.NAME": シート名}
+    """
+
+    workbook = Workbook(write_only=True)
+    used_titles = set()
+    sheets = {}
+    for model, df in definitions:
+        title = sheet_title(model["name"], used_titles)
+        worksheet = workbook.create_sheet(title=title)
+        worksheet.append(DESIRED_COLUMNS)
+        for row in df.itertuples(index=False, name=None):
+            worksheet.append(list(row))
+        sheets[qualified_name(model)] = title
     if os.path.exists(output_excel_file):
         os.remove(output_excel_file)
-    df.to_excel(output_excel_file, index=False)
-    print(f"Merged view definition has been output to '{output_excel_file}'.")
+    workbook.save(output_excel_file)
+    return sheets
+
+def patch_workbook(output_excel_file, definitions, sheet_titles, removed_titles=()):
+    """
+    既存のワークブックのうち、変更のあったモデルのシートだけを置き換える（新しいモデルは末尾に追加）。
+    removed_titles のシート（削除された・対象外になったモデル）は取り除く。
+    sheet_titles は {"DB.SCHEMA.NAME": シート名}（前回の状態）で、戻り値は更新後の同じ形式の dict
+    """
+
+    workbook = load_workbook(output_excel_file)
+    for title in removed_titles:
+        if title in workbook.sheetnames:
+            workbook.remove(workbook[title])
+    used_titles = {title.lower() for title in workbook.sheetnames}
+    sheets = {}
+    for model, df in definitions:
+        name = qualified_name(model)
+        title = sheet_titles.get(name)
+        if title in workbook.sheetnames:
+            index = workbook.sheetnames.index(title)
+            workbook.remove(workbook[title])
+        else:
+            title = sheet_title(model["name"], used_titles)
+            index = len(workbook.sheetnames)
+        worksheet = workbook.create_sheet(title=title, index=index)
+        worksheet.append(DESIRED_COLUMNS)
+        for row in df.itertuples(index=False, name=None):
+            worksheet.append(list(row))
+        sheets[name] = title
+    workbook.save(output_excel_file)
+    return sheets
 
 if __name__ == "__main__":
-    df_view = fetch_view_definition()
-    merge_with_yaml(df_view)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="ビュー定義書（xlsx）を出力する")
+    parser.add_argument("models", nargs="*", default=["*"],
+                        help="出力する dbt モデル名（glob 可、例: notion_* ）。省略時は YAML 内の全モデル")
+    parser.add_argument("--yaml-dir", default=".", help="dbt モデルの YAML を探すディレクトリ")
+    parser.add_argument("--yaml-glob", default="*.yml", help="YAML ファイルの glob（例: models/**/*.yml）")
+    parser.add_argument("--database", default=DEFAULT_DATABASE, help="YAML に database の指定がないモデルのデータベース")
+    parser.add_argument("--schema", default=DEFAULT_SCHEMA, help="YAML に schema の指定がないモデルのスキーマ")
+    parser.add_argument("--output", default=OUTPUT_EXCEL_FILE, help="出力する xlsx ファイル")
+    parser.add_argument("--incremental", action="store_true",
+                        help="前回から変更のあったビューだけをサンプリングし、既存の xlsx の該当シートだけを差し替える")
+    parser.add_argument("--state", default=STATE_FILE, help="差分出力用のマニフェストファイル")
+    parser.add_argument("--sampling", choices=[sampling.BATCH, sampling.PER_COLUMN], default=sampling.BATCH,
+                        help="サンプル値の取得方式（batch: 複数カラムを1クエリで取得 / per-column: 1カラム1クエリを並列実行）")
+    parser.add_argument("--parallelism", type=int, default=sampling.DEFAULT_PARALLELISM,
+                        help=f"同時に実行するクエリ数（最大 {MAX_CONNECTIONS}）")
+    parser.add_argument("--batch-size", type=int, default=sampling.DEFAULT_BATCH_SIZE,
+                        help="batch 方式で1クエリにまとめるカラム数")
+    parser.add_argument("--sample-rows", type=int, default=sampling.DEFAULT_SAMPLE_ROWS,
+                        help="batch 方式で SAMPLE 句により読む行数（0 で SAMPLE なし）")
+    args = parser.parse_args()
+
+    timings = {}
+    try:
+        with sampling.timed("read YAML", timings):
+            models = load_models(args.yaml_dir, args.yaml_glob, args.models, args.database, args.schema)
+        with sampling.timed("INFORMATION_SCHEMA.COLUMNS", timings):
+            columns = fetch_columns(models)
+
+        missing = [qualified_name(model) for model in models if qualified_name(model) not in columns]
+        for name in missing:
+            print(f"Skipped '{name}': not found in INFORMATION_SCHEMA.COLUMNS.")
+        models = [model for model in models if qualified_name(model) in columns]
+
+        with sampling.timed("INFORMATION_SCHEMA.TABLES", timings):
+            last_altered = fetch_last_altered(models)
+        fingerprints = {
+            qualified_name(model): fingerprint(model, columns[qualified_name(model)],
+                                               last_altered.get(qualified_name(model)))
+            for model in models
+        }
+
+        state = load_state(args.state)
+        patch = args.incremental and os.path.exists(args.output) and state.get("output") == args.output
+        previous = state.get("views", {}) if patch else {}
+        changed = [model for model in models
+                   if previous.get(qualified_name(model), {}).get("fingerprint") != fingerprints[qualified_name(model)]]
+        # 前回出力したが、削除された・指定したモデルに含まれなくなったビュー（全件出力なら出力されないもの）
+        removed = [name for name in previous if name not in fingerprints]
+        if patch:
+            print(f"Incremental: {len(changed)} of {len(models)} view(s) changed, {len(removed)} removed.")
+
+        with sampling.timed("sampling + write xlsx", timings):
+            definitions = sample_models(changed, columns, sampling_mode=args.sampling,
+                                        parallelism=min(args.parallelism, MAX_CONNECTIONS),
+                                        batch_size=args.batch_size, sample_rows=args.sample_rows, timings=timings)
+            if patch:
+                sheets = patch_workbook(args.output, definitions,
+                                        {name: view["sheet"] for name, view in previous.items()},
+                                        [previous[name]["sheet"] for name in removed])
+            else:
+                sheets = write_workbook(args.output, definitions)
+
+        views = {name: view for name, view in previous.items() if name not in removed}
+        for name, title in sheets.items():
+            views[name] = {"fingerprint": fingerprints[name], "sheet": title}
+        save_state(args.state, {"output": args.output, "views": views})
+        print(f"Merged view definition of {len(sheets)} view(s) has been output to '{args.output}'.")
+    finally:
+        print("Wall time per phase (sampling phases are summed over views sampled in parallel):")
+        sampling.print_timings(timings)
+        pool = get_connection_pool()
+        stats = pool.stats()
+        print(f"Connection pool: hit rate {stats['hit_rate']:.0%}, avg checkout wait {stats['avg_wait_ms']:.1f} ms")
+        pool.close()
@@ -0,0 +1,122 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# サンプル値の取得方式
+BATCH = "batch"            # 複数カラムを1クエリでまとめて取得（既定）
+PER_COLUMN = "per-column"  # 1カラム1クエリをスレッドプールで並列実行
+
+DEFAULT_BATCH_SIZE = 100      # 1クエリで取得するカラム数
+DEFAULT_SAMPLE_ROWS = 10000   # SAMPLE 句で読む行数（0 なら SAMPLE なし）
+DEFAULT_PARALLELISM = 8       # 同時に実行するクエリ数
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+@contextmanager
+def timed(phase, timings):
+    """処理時間（秒）を timings[phase] に記録する"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - started
+
+
+def print_timings(timings):
+    for phase, seconds in timings.items():
+        print(f"  {phase}: {seconds:.2f}s")
+
+
+def _batch_query(object_name, columns, sample_rows):
+    select_list = ",\n    ".join(
+        f"MIN(CAST({quote_identifier(col)} AS VARCHAR)) AS {quote_identifier(col)}" for col in columns
+    )
+    sample = f" SAMPLE ({sample_rows} ROWS)" if sample_rows else ""
+    return f"SELECT\n    {select_list}\nFROM {object_name}{sample}"
+
+
+def _fetch_batch(pool, object_name, columns, sample_rows, parallelism=1):
+    """
+    カラムごとの非NULL値を1クエリで取得し、({カラム名: 値}, 取り直し不要なカラムの集合) を返す。
+    クエリが失敗した場合はカラム単位（SAMPLE なし）で取り直すため、そのバッチのカラムはすべて取り直し不要になる
+    """
+    with pool.connection() as conn:
+        cs = conn.cursor()
+        try:
+            cs.execute(_batch_query(object_name, columns, sample_rows))
+            row = cs.fetchone()
+        except Exception:
+            row = None
+            failed = True
+        else:
+            failed = False
+        finally:
+            cs.close()
+    if failed:
+        # 1カラムでも CAST できないとクエリ全体が失敗するため、カラム単位で取り直す
+        return _fetch_columns(pool, object_name, columns, parallelism), set(columns)
+    return {col: value for col, value in zip(columns, row or []) if value is not None}, set()
+
+
+def _fetch_column(pool, object_name, col):
+    with pool.connection() as conn:
+        cs = conn.cursor()
+        try:
+            cs.execute(
+                f"SELECT CAST({quote_identifier(col)} AS VARCHAR) FROM {object_name} "
+                f"WHERE {quote_identifier(col)} IS NOT NULL LIMIT 1"
+            )
+            result = cs.fetchone()
+            return result[0] if result is not None else ""
+        except Exception:
+            return ""
+        finally:
+            cs.close()
+
+
+def _fetch_columns(pool, object_name, columns, parallelism=1):
+    with ThreadPoolExecutor(max_workers=parallelism) as executor:
+        values = executor.map(lambda col: _fetch_column(pool, object_name, col), columns)
+        return {col: value for col, value in zip(columns, values) if value != ""}
+
+
+def sample_column_values(pool, object_name, columns, mode=BATCH, parallelism=DEFAULT_PARALLELISM,
+                         batch_size=DEFAULT_BATCH_SIZE, sample_rows=DEFAULT_SAMPLE_ROWS, timings=None):
+    """
+    各カラムの非NULLのサンプル値を {カラム名: 値} で返す（見つからないカラムは ""）。
+
+    batch: batch_size カラムずつ MIN(CAST(col AS VARCHAR)) を SAMPLE 句付きの1クエリで取得し、
+           サンプルに非NULL値が無かったカラムだけを SAMPLE なしで取り直す。バッチは並列に実行する。
+    per-column: 従来どおり1カラム1クエリを parallelism 並列で実行する。
+    """
+    timings = timings if timings is not None else {}
+    columns = list(columns)
+    values = {}
+
+    if mode == PER_COLUMN:
+        with timed("sampling (per-column)", timings):
+            values.update(_fetch_columns(pool, object_name, columns, parallelism))
+    else:
+        resolved = set()
+        batches = [columns[i:i + batch_size] for i in range(0, len(columns), batch_size)]
+        with timed("sampling (batched, SAMPLE)", timings):
+            with ThreadPoolExecutor(max_workers=parallelism) as executor:
+                for found, done in executor.map(
+                        lambda batch: _fetch_batch(pool, object_name, batch, sample_rows, parallelism), batches):
+                    values.update(found)
+                    resolved.update(done)
+
+        # カラム単位で取り直したカラムは SAMPLE なしで確認済みのため、全件での取り直しから除く
+        missing = [col for col in columns if col not in values and col not in resolved]
+        if missing and sample_rows:
+            batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+            with timed("sampling (batched, full scan)", timings):
+                with ThreadPoolExecutor(max_workers=parallelism) as executor:
+                    for found, _ in executor.map(
+                            lambda batch: _fetch_batch(pool, object_name, batch, 0, parallelism), batches):
+                        values.update(found)
+
+    return {col: values.get(col, "") for col in columns}